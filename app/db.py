@@ -1,16 +1,204 @@
+import importlib
 import os
+import threading
+from contextlib import contextmanager
+from typing import Any, NamedTuple
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from app.services import metrics
 
 # Load .env file
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Pool sizing, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set. Please check your .env file.")
+# Set DB_ASYNC=0 to force the thread-pool fallback
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"
 
-engine = create_engine(DATABASE_URL, echo=True, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+# Log every SQL statement (very verbose; for debugging only)
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+# sync driver -> (async driver, module it needs)
+ASYNC_DRIVERS = {
+    "mysql": ("mysql+aiomysql", "aiomysql"),
+    "mysql+pymysql": ("mysql+aiomysql", "aiomysql"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+    "postgresql+psycopg2": ("postgresql+asyncpg", "asyncpg"),
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "sqlite+pysqlite": ("sqlite+aiosqlite", "aiosqlite"),
+}
+
+
+def _pool_kwargs(url) -> dict:
+    kwargs = {"pool_pre_ping": True}
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return kwargs
+
+
+def _async_url(url):
+    """Async equivalent of the configured URL, or None if no async driver is installed"""
+    if url.drivername in ("mysql+aiomysql", "mysql+asyncmy", "postgresql+asyncpg", "sqlite+aiosqlite"):
+        return url
+    target = ASYNC_DRIVERS.get(url.drivername)
+    if not target:
+        return None
+    driver, module = target
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return None
+    return url.set(drivername=driver)
+
+
+Base = declarative_base()
+
+
+class Engines(NamedTuple):
+    engine: Any
+    SessionLocal: Any
+    async_engine: Any = None
+    AsyncSessionLocal: Any = None
+
+
+_engines: Engines | None = None
+_engines_lock = threading.Lock()
+
+
+def _create_engines() -> Engines:
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL is not set. Please check your .env file.")
+
+    url = make_url(database_url)
+    sync_url = url
+    if url.drivername in ("mysql+aiomysql", "mysql+asyncmy"):
+        sync_url = url.set(drivername="mysql+pymysql")
+
+    engine = create_engine(sync_url, echo=SQL_ECHO, **_pool_kwargs(sync_url))
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    aurl = _async_url(url) if DB_ASYNC else None
+    if aurl is not None:
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        except ImportError:  # greenlet missing
+            pass
+        else:
+            async_engine = create_async_engine(aurl, echo=SQL_ECHO, **_pool_kwargs(aurl))
+            return Engines(engine, session_local, async_engine,
+                           async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    return Engines(engine, session_local)
+
+
+def get_engines() -> Engines:
+    """Engines and session factories, created on first use (per process).
+
+    Importing app.db never connects or needs DATABASE_URL, so tools and
+    worker processes can import the app before the environment is set.
+    """
+    global _engines
+    if _engines is None:
+        with _engines_lock:
+            if _engines is None:
+                _engines = _create_engines()
+    return _engines
+
+
+def __getattr__(name: str):
+    # `from app.db import DATABASE_URL, engine, SessionLocal` keeps working, lazily
+    if name == "DATABASE_URL":
+        return os.getenv("DATABASE_URL")
+    if name in Engines._fields:
+        return getattr(get_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@contextmanager
+def _timed(fn):
+    op = getattr(fn, "__name__", "query")
+    with metrics.span(f"db_{op}"), metrics.db_seconds.time(op):
+        yield
+
+
+class DBSession:
+    """Per-request DB handle that never blocks the event loop.
+
+    run(fn, *args) calls fn(session, *args) with a regular sync Session:
+    on the async driver through AsyncSession.run_sync, otherwise in the
+    thread pool. DB helpers can therefore stay plain sync functions.
+    """
+
+    def __init__(self, async_session=None, sync_session=None):
+        self.async_session = async_session
+        self.sync_session = sync_session
+
+    async def run(self, fn, *args, **kwargs):
+        with _timed(fn):
+            if self.async_session is not None:
+                return await self.async_session.run_sync(fn, *args, **kwargs)
+            return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+async def get_db():
+    """FastAPI dependency yielding a DBSession"""
+    engines = get_engines()
+    if engines.AsyncSessionLocal is not None:
+        async with engines.AsyncSessionLocal() as session:
+            yield DBSession(async_session=session)
+    else:
+        session = engines.SessionLocal()
+        try:
+            yield DBSession(sync_session=session)
+        finally:
+            await run_in_threadpool(session.close)
+
+
+async def run_db(fn, *args, **kwargs):
+    """Same as DBSession.run with a short-lived session, for code outside a request
+    (background tasks, and loads shared by several requests through SingleFlight)"""
+    engines = get_engines()
+    with _timed(fn):
+        if engines.AsyncSessionLocal is not None:
+            async with engines.AsyncSessionLocal() as session:
+                return await session.run_sync(fn, *args, **kwargs)
+
+        def _call():
+            db = engines.SessionLocal()
+            try:
+                return fn(db, *args, **kwargs)
+            finally:
+                db.close()
+
+        return await run_in_threadpool(_call)
+
+
+def pool_stats() -> dict:
+    """{(engine, stat): value} for every engine whose pool reports sizes (QueuePool)"""
+    stats = {}
+    if _engines is None:
+        return stats
+    engine, async_engine = _engines.engine, _engines.async_engine
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool if async_engine else None)):
+        if pool is None or not hasattr(pool, "checkedout"):
+            continue
+        stats[(name, "checked_out")] = pool.checkedout()
+        stats[(name, "overflow")] = max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0
+        stats[(name, "size")] = pool.size() if hasattr(pool, "size") else 0
+    return stats
+
+
+metrics.gauge("db_pool_connections", "DB pool state: size, checked_out (in use), overflow (beyond size)",
+              pool_stats, labels=("engine", "stat"))
@@ -1,11 +1,45 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import insights
+from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+from app.routers import insights, jobs as jobs_router, products
+from app.services import http_client
+from app.services import insights_service
+from app.services import jobs
+from app.services import metrics
+from app.services import refresher
+import asyncio
+import os
 import uvicorn
 
 
-app = FastAPI(title="Shopify Insights API")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+STREAMING_PATHS = ("/batch", "/stream")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# One pooled HTTP client for the whole app (keep-alive, per-host limits)
+	await http_client.start()
+
+	# Optional in-process refresh scheduler (or run `python -m app.worker`)
+	refresh_task = refresher.RefreshScheduler().start() if refresher.REFRESH_IN_PROCESS else None
+	# Async scrape jobs (POST /jobs); set JOBS_IN_PROCESS=0 to leave them to app.worker
+	job_task = jobs.runner.start() if jobs.JOBS_IN_PROCESS else None
+	# Preload the most requested brands (CACHE_WARMUP_BRANDS) without delaying startup
+	warmup_task = asyncio.create_task(insights_service.warm_cache()) if insights_service.CACHE_WARMUP_BRANDS else None
+	# Lookup counts → brands.hits (refresh priority and warmup order), whichever process runs the scheduler
+	hits_task = asyncio.create_task(insights_service.flush_hits_forever())
+	yield
+	background = [t for t in (refresh_task, job_task, warmup_task, hits_task) if t]
+	for task in background:
+		task.cancel()
+	await asyncio.gather(*background, return_exceptions=True)
+	await http_client.close()
+
+
+app = FastAPI(title="Shopify Insights API", lifespan=lifespan)
 
 # Enable CORS for all origins (customize as needed)
 app.add_middleware(
@@ -17,12 +51,46 @@ app.add_middleware(
 )
 
 
+class Compression:
+	"""Brotli (if brotli-asgi is installed) or gzip for large responses.
+
+	NDJSON streams are left alone so each line goes out as soon as it is
+	produced instead of waiting in the compressor's buffer.
+	"""
+
+	def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+		self.app = app
+		try:
+			from brotli_asgi import BrotliMiddleware
+			self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+		except ImportError:
+			self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] == "http" and scope["path"].endswith(STREAMING_PATHS):
+			return await self.app(scope, receive, send)
+		return await self.compressed(scope, receive, send)
+
+
+app.add_middleware(Compression)
+# Per-stage Server-Timing header + request latency histogram
+app.add_middleware(metrics.ServerTiming)
+
+
 app.include_router(insights.router)
+app.include_router(jobs_router.router)
+app.include_router(products.router)
 
 # Serve index.html at root
 @app.get("/", response_class=HTMLResponse)
 async def serve_index():
 	return FileResponse("index.html")
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+	return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+	# Development server with auto-reload; use `python -m app.serve` in production
 	uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, JSON
+from sqlalchemy import (
+    Column, Integer, BigInteger, Boolean, String, Text, DateTime, LargeBinary, Numeric, ForeignKey, JSON, Index,
+    UniqueConstraint, false,
+)
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.orm import relationship
 from app.db import Base
 
@@ -9,6 +13,12 @@ class Brand(Base):
     name = Column(String(255))
     url = Column(String(255), unique=True, index=True)
     about = Column(Text, nullable=True)
+    scraped_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)
+    hits = Column(Integer, default=0, nullable=False, server_default="0")   # lookups, for refresh priority
+    # zlib-compressed BrandContext JSON, exactly as served after the scrape
+    snapshot = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=True)
+    etag = Column(String(64), nullable=True)   # ETag of the uncompressed snapshot
 
     products = relationship("Product", back_populates="brand", cascade="all, delete-orphan")
     policies = relationship("PolicyDB", back_populates="brand", uselist=False, cascade="all, delete-orphan")
@@ -17,16 +27,54 @@ class Brand(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Upsert key: one row per Shopify product handle per brand
+        UniqueConstraint("brand_id", "handle", name="uq_products_brand_handle"),
+        # /products/search: keyset pagination by price, within a brand or across all of them
+        Index("ix_products_brand_price", "brand_id", "price", "id"),
+        Index("ix_products_price", "price", "id"),
+        Index("ix_products_type_price", "product_type", "price", "id"),
+        # MySQL only; other databases fall back to LIKE (see db_service.search_products)
+        Index("ft_products_title_tags", "title", "tags", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    shopify_id = Column(BigInteger, nullable=True)
+    handle = Column(String(255), nullable=False)
     title = Column(String(255))
-    price = Column(String(50))
+    price = Column(Numeric(12, 2), nullable=True)     # lowest variant price
     url = Column(String(255))
+    product_type = Column(String(255), nullable=True)
+    vendor = Column(String(255), nullable=True)
+    tags = Column(Text, nullable=True)                  # comma separated, as Shopify sends them
+    available = Column(Boolean, nullable=True)          # any variant in stock
     brand_id = Column(Integer, ForeignKey("brands.id"))
+    # sha256 of title + variants (id, title, price, availability); unchanged products are not rewritten
+    content_hash = Column(String(64), nullable=True)
+    # {variant id: [price, available]} as of the last scrape, to diff the next one against
+    variant_state = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
 
     brand = relationship("Brand", back_populates="products")
 
 
+class ProductChange(Base):
+    """Append-only log of catalog changes between scrapes (price, stock, added / removed)"""
+    __tablename__ = "product_changes"
+    __table_args__ = (Index("ix_product_changes_brand_changed", "brand_id", "changed_at"),)
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    brand_id = Column(Integer, ForeignKey("brands.id"), nullable=False)
+    handle = Column(String(255), nullable=False)
+    variant_id = Column(BigInteger, nullable=True)      # None: the product as a whole
+    change = Column(String(10), nullable=False)         # added / removed / price / stock
+    old_price = Column(Numeric(12, 2), nullable=True)
+    new_price = Column(Numeric(12, 2), nullable=True)
+    old_available = Column(Boolean, nullable=True)
+    new_available = Column(Boolean, nullable=True)
+    changed_at = Column(DateTime, nullable=False)
+
+
 class PolicyDB(Base):
     __tablename__ = "policies"
 
@@ -48,3 +96,44 @@ class ContactDB(Base):
     brand_id = Column(Integer, ForeignKey("brands.id"))
 
     brand = relationship("Brand", back_populates="contact")
+
+
+class CompetitorDB(Base):
+    __tablename__ = "competitors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    base_url = Column(String(255), unique=True, index=True)
+    competitors = Column(JSON)
+    source = Column(String(20))          # serpapi / stub / fallback (lookup failed)
+    fetched_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+
+class PageValidatorDB(Base):
+    """ETag / Last-Modified / content hash of each page fetched for a brand"""
+    __tablename__ = "page_validators"
+
+    id = Column(Integer, primary_key=True, index=True)
+    brand_id = Column(Integer, ForeignKey("brands.id"), index=True)
+    url = Column(String(512))
+    section = Column(String(20))         # homepage / products / faqs / contact / about
+    etag = Column(String(255), nullable=True)
+    last_modified = Column(String(64), nullable=True)
+    content_hash = Column(String(64))
+    fetched_at = Column(DateTime)
+
+
+class ScrapeJob(Base):
+    """Asynchronous scrape request, queued until a job runner claims it (app.services.jobs)"""
+    __tablename__ = "scrape_jobs"
+
+    id = Column(String(32), primary_key=True)          # uuid4 hex
+    url = Column(String(255), index=True)
+    status = Column(String(10), index=True)            # queued / running / done / failed
+    force_refresh = Column(Boolean, default=False, nullable=False, server_default=false())
+    attempts = Column(Integer, default=0, nullable=False, server_default="0")
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, index=True)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)     # refreshed by the runner while the job runs
+    finished_at = Column(DateTime, nullable=True)
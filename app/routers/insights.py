@@ -1,177 +1,155 @@
-from fastapi import APIRouter, HTTPException, Body
-from pydantic import BaseModel, HttpUrl
+from fastapi import APIRouter, HTTPException, Body, Header
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+import asyncio
 import httpx
+import json
+import logging
+import os
 from app.models import BrandContext, Policy, Contact, Links, FAQ, CompetitorRequest
-from app.services import scraper
 from app.services.competitor_finder import find_competitors
-from app.db import SessionLocal
-from app import models_db
-from sqlalchemy.orm import joinedload
-from typing import List, Optional
-import logging
+from app.services.politeness import RobotsDisallowed
+from app.services.insights_service import (
+    get_insights_entry, iter_insights, settle_insights, catalog_summary, shape_response, shaped_etag, cache_stats,
+)
+from app.services.scraper import normalize_url
+from typing import List, Literal, Optional
 
 
 router = APIRouter()
 
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "1000"))
+
 class StoreRequest(BaseModel):
     website_url: str
+    max_age: Optional[int] = None   # seconds; older cached data is re-scraped before answering
+    force_refresh: bool = False     # skip the DB and scrape now
+    fields: Optional[List[str]] = None          # only return these BrandContext fields
+    product_limit: Optional[int] = Field(None, ge=0)
+    product_offset: int = Field(0, ge=0)
+    product_view: Literal["full", "slim"] = "full"   # slim: id, title, handle, min/max price
+
+class BatchStoreRequest(BaseModel):
+    website_urls: List[str]
+    max_age: Optional[int] = None
+    force_refresh: bool = False
 
 class CompetitorRequest(BaseModel):
     website_url: HttpUrl
     competitor_urls: Optional[List[HttpUrl]] = None
+    include_insights: bool = False   # also load/scrape every store and compare catalogs
 
 @router.post("/get_competitors")
 async def get_competitors(req: CompetitorRequest):
     main_url = str(req.website_url)
 
+    # Start on the main store right away so it overlaps with the competitor lookup
+    main_task = asyncio.create_task(settle_insights(normalize_url(main_url))) if req.include_insights else None
+
     if req.competitor_urls:
         competitors = [str(url) for url in req.competitor_urls]
+        source = "request"
     else:
         try:
-            competitors = await find_competitors(main_url)
+            lookup = await find_competitors(main_url)
         except Exception as e:
+            if main_task:
+                main_task.cancel()
             raise HTTPException(status_code=500, detail=f"Failed to fetch competitors: {e}")
-
-    return {"main": main_url, "competitors": competitors}
-
-def get_brand_context_from_db(url: str) -> BrandContext | None:
-    db = SessionLocal()
-    try:
-        brand = (
-            db.query(models_db.Brand)
-            .options(
-                joinedload(models_db.Brand.products),
-                joinedload(models_db.Brand.policies),
-                joinedload(models_db.Brand.contact),
-            )
-            .filter(models_db.Brand.url == url)
-            .first()
-        )
-        if not brand:
-            return None
-
-        return BrandContext(
-            brand_name=brand.name,
-            about=brand.about,
-            product_catalog=[{"title": p.title, "price": p.price, "url": p.url} for p in brand.products],
-            hero_products=[],
-            policies=Policy(
-                privacy_policy=brand.policies.privacy_policy if brand.policies else None,
-                return_policy=brand.policies.return_policy if brand.policies else None,
-            ),
-            faqs=[],
-            social_handles={},
-            contact=Contact(
-                emails=brand.contact.emails if brand.contact else [],
-                phones=brand.contact.phones if brand.contact else [],
-                address=brand.contact.address if brand.contact else None,
-            ),
-            links=Links()
-        )
-    finally:
-        db.close()
-async def save_to_db(insights: BrandContext, url: str):
-    db = SessionLocal()
-    try:
-        # Check if brand already exists (avoid duplicate inserts)
-        existing_brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
-        if existing_brand:
-            brand = existing_brand
-        else:
-            brand = models_db.Brand(
-                name=insights.brand_name,
-                url=url,
-                about=insights.about,
-            )
-            db.add(brand)
-            db.flush()  # brand.id is available
-
-        # Products
-        for p in insights.product_catalog:
-            db.add(models_db.Product(
-                title=p.get("title"),
-                price=p.get("price") or 0.0,  # Avoid None if column is NOT NULL
-                url=p.get("handle") or p.get("url") or "",  # Ensure not NULL
-                brand_id=brand.id
-            ))
-
-        # Policies (if one already exists, update)
-        if insights.policies:
-            policy = db.query(models_db.PolicyDB).filter(models_db.PolicyDB.brand_id == brand.id).first()
-            if policy:
-                policy.privacy_policy = insights.policies.privacy_policy
-                policy.return_policy = insights.policies.return_policy
-            else:
-                db.add(models_db.PolicyDB(
-                    privacy_policy=insights.policies.privacy_policy,
-                    return_policy=insights.policies.return_policy or "",
-                    brand_id=brand.id
-                ))
-
-        # Contact
-        if insights.contact:
-            contact = db.query(models_db.ContactDB).filter(models_db.ContactDB.brand_id == brand.id).first()
-            if contact:
-                contact.emails = insights.contact.emails
-                contact.phones = insights.contact.phones
-                contact.address = getattr(insights.contact, "address", None)
-            else:
-                db.add(models_db.ContactDB(
-                    emails=insights.contact.emails if hasattr(insights.contact, "emails") else [],
-                    phones=insights.contact.phones if hasattr(insights.contact, "phones") else [],
-                    address=getattr(insights.contact, "address", None),
-                    brand_id=brand.id
-                ))
-
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logging.exception("Failed to save to DB")
-        raise
-    finally:
-        db.close()
+        competitors, source = lookup.competitors, lookup.source
+
+    # fallback=True means the lookup failed and these are the built-in defaults
+    result = {"main": main_url, "competitors": competitors, "source": source, "fallback": source == "fallback"}
+    if not req.include_insights:
+        return result
+
+    # Competitors fan out concurrently (scrapes bounded by SCRAPE_CONCURRENCY)
+    results = await asyncio.gather(main_task, *(settle_insights(normalize_url(u)) for u in competitors))
+
+    insights, comparison = {}, []
+    for url, body, error in results:
+        if error is not None:
+            detail = "Website not found" if isinstance(error, httpx.HTTPStatusError) else str(error)
+            insights[url] = {"error": detail}
+            continue
+        data = json.loads(body)
+        insights[url] = data
+        comparison.append({"url": url, **catalog_summary(data)})
+
+    return {**result, "insights": insights, "comparison": comparison}
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, so W/ validators from proxies still match)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
 
 @router.post("/fetch_store_insights", response_model=BrandContext)
-async def fetch_store_insights(req: StoreRequest):
+async def fetch_store_insights(req: StoreRequest, if_none_match: Optional[str] = Header(None)):
     try:
-        website_url = req.website_url
-        if not website_url.startswith("http"):
-            website_url = "https://" + website_url
-
-        # ✅ 1. Check DB
-        brand_in_db = get_brand_context_from_db(website_url)
-        if brand_in_db:
-            return brand_in_db
-
-        # ✅ 2. If not in DB → scrape
-        brand_name = await scraper.get_brand_name(website_url) 
-        products = await scraper.get_product_catalog(website_url) 
-        hero_products = await scraper.get_hero_products(website_url) 
-        policies = await scraper.get_policies(website_url) 
-        faqs = await scraper.get_faqs(website_url) 
-        socials = await scraper.get_social_handles(website_url) 
-        contact = await scraper.get_contact_details(website_url) 
-        about = await scraper.get_about_text(website_url) 
-        links = await scraper.get_links(website_url) 
-
-        insights = BrandContext( 
-                            brand_name=brand_name, 
-                            product_catalog=products, 
-                            hero_products=hero_products, 
-                            policies=Policy(**policies) if policies else Policy(), 
-                            faqs=[FAQ(**f) for f in faqs] if faqs else [], 
-                            social_handles=socials, 
-                            contact=Contact(**contact) if contact else Contact(), 
-                            about=about, 
-                            links=Links(**links) if links else Links() )
-
-        # ✅ 3. Save scraped data into DB
-        await save_to_db(insights, website_url)
-
-        return insights
+        website_url = normalize_url(req.website_url)
+        if req.fields:
+            unknown = set(req.fields) - set(BrandContext.model_fields)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        # ✅ LRU → DB → scrape (+ save); concurrent callers share one load / scrape
+        entry = await get_insights_entry(website_url, max_age=req.max_age, force_refresh=req.force_refresh)
+        slim = req.product_view == "slim"
+        etag = shaped_etag(entry.etag, req.fields, req.product_limit, req.product_offset, slim)
+        # Weak: the Compression middleware re-encodes the body, so it is only semantically the same
+        headers = {"ETag": f"W/{etag}", "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        body = shape_response(entry.body, req.fields, req.product_limit, req.product_offset, slim)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
 
     except httpx.HTTPStatusError:
         raise HTTPException(status_code=401, detail="Website not found")
+    except RobotsDisallowed as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/fetch_store_insights/batch")
+async def fetch_store_insights_batch(req: BatchStoreRequest):
+    """Insights for many stores, streamed as NDJSON lines as each store completes"""
+    if len(req.website_urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_URLS} URLs per batch")
+
+    def error_line(url: str, error: Exception) -> bytes:
+        detail = "Website not found" if isinstance(error, httpx.HTTPStatusError) else str(error)
+        return json.dumps({"url": url, "ok": False, "error": detail}, separators=(",", ":")).encode() + b"\n"
+
+    async def lines():
+        urls = [normalize_url(u) for u in req.website_urls]
+        answered = set()
+        try:
+            async for url, body, error in iter_insights(urls, max_age=req.max_age, force_refresh=req.force_refresh):
+                answered.add(url)
+                if error is None:
+                    # body is already BrandContext JSON, spliced in without re-encoding
+                    yield b'{"url":' + json.dumps(url).encode() + b',"ok":true,"data":' + body + b"}\n"
+                else:
+                    yield error_line(url, error)
+        except Exception as e:
+            # e.g. the bulk DB lookup failed: every store not answered yet gets the error
+            logging.warning("Batch insights stopped early: %s", e)
+            for url in dict.fromkeys(urls):
+                if url not in answered:
+                    yield error_line(url, e)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit / miss / coalesce counters for the insights cache"""
+    return cache_stats()
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+import json
+from app.db import DBSession, get_db
+from app.services import jobs
+from app.services.db_service import enqueue_job, get_job
+from app.services.insights_service import get_insights
+from app.services.scraper import normalize_url
+
+
+router = APIRouter()
+
+class JobRequest(BaseModel):
+    website_url: str
+    force_refresh: bool = False     # scrape even if the DB has fresh data
+
+@router.post("/jobs", status_code=202)
+async def create_job(req: JobRequest, db: DBSession = Depends(get_db)):
+    """Queue a scrape and return at once; poll GET /jobs/{id} or follow /jobs/{id}/stream"""
+    job = await db.run(enqueue_job, normalize_url(req.website_url), req.force_refresh)
+    jobs.runner.wake()
+    job_id = job["job_id"]
+    return JSONResponse(
+        {**job, "status_url": f"/jobs/{job_id}", "stream_url": f"/jobs/{job_id}/stream"},
+        status_code=202,
+    )
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, db: DBSession = Depends(get_db)):
+    """Job status; once done, the insights are included as `result`"""
+    job = await db.run(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        return job
+    try:
+        body = await get_insights(job["url"])
+    except Exception:
+        return job
+    # body is already BrandContext JSON, spliced in without re-encoding
+    head = json.dumps(job, separators=(",", ":")).encode()
+    return Response(content=head[:-1] + b',"result":' + body + b"}", media_type="application/json")
+
+@router.get("/jobs/{job_id}/stream")
+async def job_stream(job_id: str, db: DBSession = Depends(get_db)):
+    """NDJSON: job status, then each section as it is scraped, then the full result"""
+    job = await db.run(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(jobs.follow_job(job), media_type="application/x-ndjson")
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Literal, Optional
+from app.db import DBSession, get_db, run_db
+from app.services import metrics
+from app.services.cache import CacheEntry, LRUCache, SingleFlight
+from app.services.db_service import ProductQuery, decode_cursor, get_product_changes, product_facets, search_products
+from app.services.scraper import normalize_url
+
+
+router = APIRouter()
+
+# Facet counts are full GROUP BYs over every match, so they are cached per query for this long
+SEARCH_FACET_CACHE_SECONDS = float(os.getenv("SEARCH_FACET_CACHE_SECONDS", "60"))
+_facets_cache = LRUCache(max_entries=int(os.getenv("SEARCH_FACET_CACHE_ENTRIES", "1000")), ttl=SEARCH_FACET_CACHE_SECONDS)
+_facets_inflight = SingleFlight()
+metrics.register_cache("search_facets", _facets_cache)
+
+
+async def _load_facets(key: str, query: ProductQuery) -> dict:
+    counts = await run_db(product_facets, query)
+    _facets_cache.set(key, CacheEntry(json.dumps(counts).encode()))
+    return counts
+
+
+async def _facets(query: ProductQuery) -> dict:
+    key = json.dumps(query._asdict(), default=str, sort_keys=True)
+    entry = _facets_cache.get(key)
+    if entry is not None:
+        return json.loads(entry.body)
+    return await _facets_inflight.do(key, lambda: _load_facets(key, query))
+
+@router.get("/products/search")
+async def products_search(
+    q: Optional[str] = None,
+    brand: Optional[List[str]] = Query(None),          # repeat to search several stores
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    product_type: Optional[str] = None,
+    available: Optional[bool] = None,
+    sort: Literal["price_asc", "price_desc"] = "price_asc",
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    facets: bool = False,
+    db: DBSession = Depends(get_db),
+):
+    """Products across every stored brand, filtered by text / store / price / type / stock.
+
+    Pages are keyset-paginated: pass `next_cursor` back as `cursor` for the
+    next page. `facets=true` adds match counts per brand, product type and price
+    range (first page only, cached for SEARCH_FACET_CACHE_SECONDS).
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    query = ProductQuery(
+        q=q,
+        brands=[normalize_url(b) for b in brand] if brand else None,
+        min_price=min_price,
+        max_price=max_price,
+        product_type=product_type,
+        available=available,
+    )
+    search = db.run(search_products, query, sort, limit, cursor)
+    if facets and not cursor:
+        # Facets describe the whole result set, so only the first page computes them
+        (items, next_cursor), counts = await asyncio.gather(search, _facets(query))
+    else:
+        (items, next_cursor), counts = await search, None
+    result = {"items": items, "next_cursor": next_cursor}
+    if counts is not None:
+        result["facets"] = counts
+    return result
+
+@router.get("/products/changes")
+async def product_changes(
+    website_url: str,
+    since: datetime,
+    limit: int = Query(1000, ge=1, le=10000),
+    cursor: Optional[int] = None,
+    db: DBSession = Depends(get_db),
+):
+    """Price / stock / added / removed product changes for a store since a timestamp.
+
+    Changes are recorded between scrapes, oldest first; pass `next_cursor`
+    back as `cursor` while it is not null to read the rest.
+    """
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    url = normalize_url(website_url)
+    result = await db.run(get_product_changes, url, since, limit, cursor)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Store not tracked yet")
+    changes, next_cursor = result
+    return {"url": url, "since": since.isoformat(), "changes": changes, "next_cursor": next_cursor}
@@ -0,0 +1,50 @@
+import logging
+import os
+import shutil
+import tempfile
+import uvicorn
+from dotenv import load_dotenv
+
+
+def main():
+	"""Production entry point: several uvicorn worker processes sharing one L2 cache.
+
+	Each worker has its own in-memory LRU, DB pools and HTTP client; the
+	SQLite-backed shared cache (SHARED_CACHE_PATH) lets them reuse each
+	other's loads and scrapes. Run `python -m app.worker` next to it for
+	scheduled refreshes.
+	"""
+	load_dotenv()
+	workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+	cache_dir = None
+	if workers > 1 and "SHARED_CACHE_PATH" not in os.environ:
+		# Private (0700) directory for this run only; inherited by the worker processes,
+		# which open the cache on import
+		cache_dir = tempfile.mkdtemp(prefix="shopify-insights-")
+		os.environ["SHARED_CACHE_PATH"] = os.path.join(cache_dir, "cache.db")
+	if workers > 1:
+		# Each worker keeps its own counters: tell them apart in /metrics
+		os.environ.setdefault("METRICS_PID_LABEL", "1")
+	logging.basicConfig(level=logging.INFO)
+	try:
+		_run(workers)
+	finally:
+		if cache_dir:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _run(workers: int):
+	uvicorn.run(
+		"app.main:app",
+		host=os.getenv("HOST", "0.0.0.0"),
+		port=int(os.getenv("PORT", "8000")),
+		workers=workers,
+		proxy_headers=True,
+		forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+		timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT", "5")),
+		log_level=os.getenv("LOG_LEVEL", "info"),
+	)
+
+
+if __name__ == "__main__":
+	main()
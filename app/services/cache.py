@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, NamedTuple
+
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag of a serialized response"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    scraped_at: Any = None   # datetime the cached data was scraped, if known
+    etag: str | None = None  # body_etag(body)
+
+
+class LRUCache:
+    """Bounded in-memory LRU of serialized responses.
+
+    Entries expire after `ttl` seconds; the least recently used ones are
+    evicted once there are more than `max_entries` or their bodies add up
+    to more than `max_bytes`.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, CacheEntry]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> CacheEntry | None:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, entry = item
+        if expires <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, entry: CacheEntry, ttl: float | None = None):
+        self.pop(key)   # even if the new body is too big to keep: the old one is stale now
+        if len(entry.body) > self.max_bytes:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), entry)
+        self.size += len(entry.body)
+        while len(self._data) > self.max_entries or self.size > self.max_bytes:
+            _, (_, old) = self._data.popitem(last=False)
+            self.size -= len(old.body)
+            self.evictions += 1
+
+    def pop(self, key: str):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1].body)
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Let concurrent callers for the same key share one in-flight call"""
+
+    def __init__(self):
+        self._calls: dict[Any, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    async def do(self, key, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shielded so one caller disconnecting doesn't cancel the others' work
+        return await asyncio.shield(task)
@@ -1,46 +1,147 @@
 import os
+import json
+import logging
+from typing import NamedTuple
 from serpapi import GoogleSearch
 import asyncio
-import httpx
+from app.services import http_client, metrics
+from app.services.cache import CacheEntry, LRUCache, SingleFlight
+from app.services.db_service import get_competitors_from_db, save_competitors_to_db, utcnow
+from app.services.scraper import normalize_url
+from app.db import run_db
 
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")  # get your key from serpapi.com
 
+# "serpapi" (paid, network) or "stub" (local, for tests / offline runs)
+COMPETITOR_BACKEND = os.getenv("COMPETITOR_BACKEND", "serpapi")
+COMPETITOR_STUB_FILE = os.getenv("COMPETITOR_STUB_FILE")
 
+# Successful lookups are kept for a week, failures only briefly
+COMPETITOR_TTL_SECONDS = int(os.getenv("COMPETITOR_TTL_SECONDS", str(7 * 24 * 3600)))
+COMPETITOR_NEGATIVE_TTL_SECONDS = int(os.getenv("COMPETITOR_NEGATIVE_TTL_SECONDS", "600"))
+# Every search asks for this many; callers get a slice, so the cached list never depends on who asked first
+COMPETITOR_SEARCH_LIMIT = int(os.getenv("COMPETITOR_SEARCH_LIMIT", "10"))
 
-async def find_competitors(base_url: str, limit: int = 5):
-    SERPAPI_KEY = os.getenv("SERPAPI_KEY")
-    if not SERPAPI_KEY:
-        raise RuntimeError("SERPAPI_KEY not set")
+FALLBACK_COMPETITORS = [
+    "https://www.beyoung.in",
+    "https://www.snitch.co.in",
+    "https://www.freakins.com",
+]
 
-    url = "https://serpapi.com/search.json"
-    query = f"{base_url} site:shopify.com"
-    params = {"q": query, "api_key": SERPAPI_KEY, "num": limit}
+# In-memory front cache for the competitors table
+_memory = LRUCache(max_entries=int(os.getenv("COMPETITOR_CACHE_ENTRIES", "1000")), ttl=COMPETITOR_TTL_SECONDS)
+_inflight = SingleFlight()
+metrics.register_cache("competitors", _memory)
 
-    links = []
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            data = resp.json()
 
+class CompetitorLookup(NamedTuple):
+    competitors: list[str]
+    source: str          # serpapi / stub / fallback
+    cached: bool = False
+
+    @property
+    def fallback(self) -> bool:
+        return self.source == "fallback"
+
+
+class SerpApiBackend:
+    name = "serpapi"
+
+    async def search(self, base_url: str, limit: int) -> list[str]:
+        SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+        if not SERPAPI_KEY:
+            raise RuntimeError("SERPAPI_KEY not set")
+
+        url = "https://serpapi.com/search.json"
+        query = f"{base_url} site:shopify.com"
+        params = {"q": query, "api_key": SERPAPI_KEY, "num": limit}
+
+        resp = await http_client.get(url, params=params, timeout=10.0)
+        resp.raise_for_status()
+        data = resp.json()
+
+        links = []
         for res in data.get("organic_results", []):
             link = res.get("link")
             if link and base_url not in link and link not in links:
                 links.append(link)
             if len(links) >= limit:
                 break
+        return links
+
+
+class StubBackend:
+    """Offline search backend.
+
+    Reads {base_url: [competitor, ...]} from COMPETITOR_STUB_FILE (a "*"
+    key acts as the default); without a file every store gets the
+    fallback list.
+    """
+    name = "stub"
+
+    def __init__(self, path: str | None = None):
+        self.results = {}
+        if path:
+            with open(path) as f:
+                self.results = json.load(f)
+
+    async def search(self, base_url: str, limit: int) -> list[str]:
+        links = self.results.get(normalize_url(base_url)) or self.results.get("*") or FALLBACK_COMPETITORS
+        return [link for link in links if base_url not in link][:limit]
+
 
+def get_backend():
+    if COMPETITOR_BACKEND == "stub":
+        return StubBackend(COMPETITOR_STUB_FILE)
+    return SerpApiBackend()
+
+
+backend = get_backend()
+
+
+def _remember(key: str, competitors: list[str], source: str, ttl: int):
+    _memory.set(key, CacheEntry(json.dumps({"competitors": competitors, "source": source}).encode()), ttl=ttl)
+
+
+async def _lookup(key: str, base_url: str) -> CompetitorLookup:
+    """Up to COMPETITOR_SEARCH_LIMIT competitors: DB → search backend (callers slice)"""
+    limit = COMPETITOR_SEARCH_LIMIT
+    stored = await run_db(get_competitors_from_db, key)
+    if stored:
+        competitors, source, expires_at = stored
+        # Only for as long as the row itself is still valid
+        _remember(key, competitors, source, max((expires_at - utcnow()).total_seconds(), 0))
+        return CompetitorLookup(competitors, source, cached=True)
+
+    try:
+        links = await backend.search(base_url, limit)
+    except RuntimeError:
+        raise  # misconfiguration (e.g. missing key), not worth caching
     except Exception as e:
-        print(f"⚠️ SerpAPI request failed: {e}")
-
-    # ✅ Fallback: if no competitors found, return backup list
-    if not links:
-        links = [
-            "https://www.beyoung.in",
-            "https://www.snitch.co.in",
-            "https://www.freakins.com",
-            
-        ][:limit]
-
-    return links
\ No newline at end of file
+        logging.warning("⚠️ %s competitor lookup for %s failed: %s", backend.name, base_url, e)
+        links = []
+
+    if links:
+        source, ttl = backend.name, COMPETITOR_TTL_SECONDS
+    else:
+        # ✅ Explicit fallback, cached briefly as a negative result
+        links, source, ttl = FALLBACK_COMPETITORS[:limit], "fallback", COMPETITOR_NEGATIVE_TTL_SECONDS
+
+    _remember(key, links, source, ttl)
+    try:
+        await run_db(save_competitors_to_db, key, links, source, ttl)
+    except Exception:
+        pass  # already logged; the in-memory copy still saves the next lookup
+    return CompetitorLookup(links, source)
+
+
+async def find_competitors(base_url: str, limit: int = 5) -> CompetitorLookup:
+    """Competitor store URLs for base_url: memory cache → DB → search backend"""
+    key = normalize_url(base_url)
+    entry = _memory.get(key)
+    if entry is not None:
+        data = json.loads(entry.body)
+        return CompetitorLookup(data["competitors"][:limit], data["source"], cached=True)
+    lookup = await _inflight.do(key, lambda: _lookup(key, base_url))
+    return lookup._replace(competitors=lookup.competitors[:limit])
@@ -1,10 +1,850 @@
-from app.db import SessionLocal
+import logging
+import os
+import hashlib
+import json
+import random
+import re
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import NamedTuple
+from sqlalchemy import and_, case, delete, func, insert, or_, select, text, update, bindparam
+from app.db import get_engines
 from app import models_db
+from app.models import BrandContext, Policy, Contact, Links
+from app.services.cache import body_etag
+from app.services.scraper import Validator
+
+# Rows per multi-row INSERT ... ON DUPLICATE KEY UPDATE statement
+PRODUCT_BATCH_SIZE = int(os.getenv("PRODUCT_BATCH_SIZE", "500"))
+
+# How long scraped insights stay fresh before a refresh is due
+BRAND_TTL_SECONDS = int(os.getenv("BRAND_TTL_SECONDS", "86400"))
+# ± fraction applied to each TTL so refreshes don't all fall due together
+BRAND_TTL_JITTER = float(os.getenv("BRAND_TTL_JITTER", "0.1"))
+
+SNAPSHOT_COMPRESSION_LEVEL = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", "6"))
+
+# /products/search facets: values per facet, and the price range boundaries
+SEARCH_FACET_LIMIT = int(os.getenv("SEARCH_FACET_LIMIT", "20"))
+SEARCH_PRICE_RANGES = [int(b) for b in os.getenv("SEARCH_PRICE_RANGES", "500,1000,2500,5000").split(",")]
+
+
+def utcnow() -> datetime:
+    """Naive UTC now, matching the DateTime columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CachedBrand(NamedTuple):
+    body: bytes                 # serialized BrandContext, as returned to clients
+    scraped_at: datetime | None
+    expires_at: datetime | None
+    etag: str | None = None
+
+    @property
+    def insights(self) -> BrandContext:
+        return BrandContext.model_validate_json(self.body)
+
+    def age(self) -> float | None:
+        """Seconds since the brand was scraped (None if unknown)"""
+        if self.scraped_at is None:
+            return None
+        return (utcnow() - self.scraped_at).total_seconds()
+
+    def is_stale(self) -> bool:
+        return self.expires_at is None or utcnow() >= self.expires_at
+
+
+def next_expiry(now: datetime) -> datetime:
+    ttl = BRAND_TTL_SECONDS * (1 + random.uniform(-BRAND_TTL_JITTER, BRAND_TTL_JITTER))
+    return now + timedelta(seconds=ttl)
+
+
+def pack_snapshot(body: bytes) -> bytes:
+    """Compress a serialized BrandContext for Brand.snapshot"""
+    return zlib.compress(body, SNAPSHOT_COMPRESSION_LEVEL)
+
+
+def unpack_snapshot(blob: bytes) -> bytes:
+    return zlib.decompress(blob)
+
 
 def get_brand_from_db(url: str):
-    db = SessionLocal()
+    db = get_engines().SessionLocal()
     try:
         brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
         return brand
     finally:
         db.close()
+
+
+def product_hash(p: dict) -> str:
+    """sha256 over every stored product field: title, type, tags, variants, prices, availability"""
+    variants = [
+        (v.get("id"), v.get("title"), v.get("price"), v.get("compare_at_price"), v.get("available"))
+        for v in p.get("variants") or []
+    ]
+    key = json.dumps([p.get("title"), p.get("price"), p.get("product_type"), p.get("tags"), variants],
+                     separators=(",", ":"), default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def variant_state(p: dict) -> dict:
+    """{variant id: [price, available]} of a Shopify product (JSON keys, so ids as str)"""
+    return {
+        str(v.get("id")): [None if v.get("price") is None else str(v.get("price")), v.get("available")]
+        for v in p.get("variants") or []
+    }
+
+
+def product_row(p: dict, brand_id: int) -> dict:
+    """Flatten a Shopify product dict into a products table row"""
+    handle = p.get("handle") or p.get("url") or str(p.get("id") or "")
+    variants = p.get("variants") or []
+    prices = [price for price in (_price(v.get("price")) for v in variants) if price is not None]
+    price = min(prices) if prices else _price(p.get("price"))
+    availability = [v.get("available") for v in variants if v.get("available") is not None]
+    tags = p.get("tags")
+    if isinstance(tags, list):
+        tags = ", ".join(tags)
+    shopify_id = p.get("id")
+    return {
+        "brand_id": brand_id,
+        "shopify_id": shopify_id if isinstance(shopify_id, int) else None,
+        "handle": handle[:255],
+        "title": (p.get("title") or "")[:255],
+        "price": price,
+        "url": (p.get("handle") or p.get("url") or "")[:255],
+        "product_type": (p.get("product_type") or "")[:255] or None,
+        "vendor": (p.get("vendor") or "")[:255] or None,
+        "tags": tags or None,
+        "available": any(availability) if availability else None,
+        "content_hash": product_hash(p),
+        "variant_state": variant_state(p) if variants else {"": [p.get("price"), None]},
+    }
+
+
+def _upsert_products_stmt(db):
+    table = models_db.Product.__table__
+    update_cols = [
+        "shopify_id", "title", "price", "url", "product_type", "vendor", "tags", "available",
+        "content_hash", "variant_state", "updated_at",
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=["brand_id", "handle"],
+        set_={c: stmt.excluded[c] for c in update_cols},
+    )
+
+
+def _price(value) -> Decimal | None:
+    try:
+        return Decimal(value).quantize(Decimal("0.01"))
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+
+
+def _change(brand_id: int, handle: str, variant: str | None, change: str, old, new, now: datetime) -> dict:
+    old_price, old_available = old or (None, None)
+    new_price, new_available = new or (None, None)
+    return {
+        "brand_id": brand_id,
+        "handle": handle,
+        "variant_id": int(variant) if variant and variant.isdigit() else None,
+        "change": change,
+        "old_price": _price(old_price),
+        "new_price": _price(new_price),
+        "old_available": old_available,
+        "new_available": new_available,
+        "changed_at": now,
+    }
+
+
+def diff_variants(brand_id: int, handle: str, old: dict, new: dict, now: datetime) -> list[dict]:
+    """product_changes rows for one product between two scrapes"""
+    changes = []
+    for variant, state in new.items():
+        before = old.get(variant)
+        if before is None:
+            changes.append(_change(brand_id, handle, variant, "added", None, state, now))
+            continue
+        if before[0] != state[0]:
+            changes.append(_change(brand_id, handle, variant, "price", before, state, now))
+        if before[1] != state[1]:
+            changes.append(_change(brand_id, handle, variant, "stock", before, state, now))
+    for variant, state in old.items():
+        if variant not in new:
+            changes.append(_change(brand_id, handle, variant, "removed", state, None, now))
+    return changes
+
+
+def _summary_state(state: dict | None):
+    """(first price, any variant available) of a whole product"""
+    if not state:
+        return None
+    values = list(state.values())
+    available = [a for _, a in values if a is not None]
+    return values[0][0], any(available) if available else None
+
+
+class CatalogDiff(NamedTuple):
+    written: int        # new or changed products upserted
+    unchanged: int      # same content hash, not touched
+    removed: int
+    changes: int        # product_changes rows appended
+
+
+def upsert_products(db, brand_id: int, products: list[dict], now: datetime | None = None,
+                    complete: bool = False) -> CatalogDiff:
+    """Write a brand's catalog incrementally, keyed on (brand_id, handle).
+
+    Products whose content hash matches the stored one are skipped; the
+    rest go out in PRODUCT_BATCH_SIZE executemany batches. With complete=True
+    (every page fetched, not capped) products no longer in the store are
+    deleted and logged as removed; a partial catalog only adds and updates. Price / stock / added / removed
+    changes are appended to product_changes, except on a brand's first
+    catalog (everything would be "added"). An empty catalog is treated as
+    a failed fetch and leaves the stored products alone.
+    """
+    if not products:
+        return CatalogDiff(0, 0, 0, 0)
+    now = now or utcnow()
+
+    # Dedupe on the key so one batch never hits the same row twice
+    rows = {}
+    for p in products:
+        row = product_row(p, brand_id)
+        rows[row["handle"]] = row
+
+    Product = models_db.Product
+    stored = {
+        handle: (content_hash, state)
+        for handle, content_hash, state in db.query(Product.handle, Product.content_hash, Product.variant_state)
+        .filter(Product.brand_id == brand_id)
+    }
+
+    changed, history = [], []
+    for handle, row in rows.items():
+        content_hash, state = stored.get(handle, (None, None))
+        if content_hash == row["content_hash"]:
+            continue
+        row["updated_at"] = now
+        changed.append(row)
+        if not stored:
+            continue
+        if handle not in stored:
+            history.append(_change(brand_id, handle, None, "added", None, _summary_state(row["variant_state"]), now))
+        elif state is not None:
+            history.extend(diff_variants(brand_id, handle, state, row["variant_state"], now))
+
+    missing = [handle for handle in stored if handle not in rows]
+    # Only a complete catalog shows they're gone, not just on a page that failed or past the cap
+    removed = missing if complete else []
+    for handle in removed:
+        history.append(_change(brand_id, handle, None, "removed", _summary_state(stored[handle][1]), None, now))
+
+    if changed:
+        stmt = _upsert_products_stmt(db)
+        for i in range(0, len(changed), PRODUCT_BATCH_SIZE):
+            db.execute(stmt, changed[i:i + PRODUCT_BATCH_SIZE])
+    for i in range(0, len(removed), PRODUCT_BATCH_SIZE):
+        db.execute(delete(Product).where(Product.brand_id == brand_id, Product.handle.in_(removed[i:i + PRODUCT_BATCH_SIZE])))
+    if history:
+        table = models_db.ProductChange.__table__
+        for i in range(0, len(history), PRODUCT_BATCH_SIZE):
+            db.execute(insert(table), history[i:i + PRODUCT_BATCH_SIZE])
+
+    return CatalogDiff(len(changed), len(rows) - len(changed), len(removed), len(history))
+
+
+def get_brand_context_from_db(db, url: str) -> BrandContext | None:
+    """Load a stored brand as a BrandContext (run through DBSession.run / run_db)"""
+    cached = get_cached_brand(db, url)
+    return cached.insights if cached else None
+
+
+def _snapshot_query(db):
+    # Just the columns a cache hit needs, read through the unique url index; no ORM objects
+    Brand = models_db.Brand
+    return db.query(Brand.url, Brand.snapshot, Brand.etag, Brand.scraped_at, Brand.expires_at)
+
+
+def _cached_from_snapshot(row) -> CachedBrand:
+    body = unpack_snapshot(row.snapshot)
+    return CachedBrand(body, row.scraped_at, row.expires_at, row.etag or body_etag(body))
+
+
+def get_cached_brand(db, url: str) -> CachedBrand | None:
+    """Stored brand plus its scrape timestamps and ETag.
+
+    Brands saved with a snapshot come back from one indexed row read of the
+    snapshot columns, exactly as they were serialized after the scrape.
+    Older rows without one are rebuilt from the products / policies /
+    contacts tables.
+    """
+    row = _snapshot_query(db).filter(models_db.Brand.url == url).first()
+    if row is None:
+        return None
+    if row.snapshot is not None:
+        return _cached_from_snapshot(row)
+    brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
+    return _cached_from_row(brand) if brand else None
+
+
+def get_cached_brands(db, urls: list[str]) -> dict[str, CachedBrand]:
+    """Batch version of get_cached_brand: one WHERE url IN (...) query"""
+    if not urls:
+        return {}
+    cached, legacy = {}, []
+    for row in _snapshot_query(db).filter(models_db.Brand.url.in_(urls)).all():
+        if row.snapshot is not None:
+            cached[row.url] = _cached_from_snapshot(row)
+        else:
+            legacy.append(row.url)
+    if legacy:
+        for brand in db.query(models_db.Brand).filter(models_db.Brand.url.in_(legacy)).all():
+            cached[brand.url] = _cached_from_row(brand)
+    return cached
+
+
+def _cached_from_row(brand) -> CachedBrand:
+    """Rebuild a brand saved before snapshots existed"""
+    insights = BrandContext(
+        brand_name=brand.name,
+        about=brand.about,
+        product_catalog=[
+            {"title": p.title, "price": None if p.price is None else str(p.price), "url": p.url}
+            for p in brand.products
+        ],
+        hero_products=[],
+        policies=Policy(
+            privacy_policy=brand.policies.privacy_policy if brand.policies else None,
+            return_policy=brand.policies.return_policy if brand.policies else None,
+        ),
+        faqs=[],
+        social_handles={},
+        contact=Contact(
+            emails=brand.contact.emails if brand.contact else [],
+            phones=brand.contact.phones if brand.contact else [],
+            address=brand.contact.address if brand.contact else None,
+        ),
+        links=Links()
+    )
+    body = insights.model_dump_json().encode()
+    return CachedBrand(body, brand.scraped_at, brand.expires_at, body_etag(body))
+
+
+def save_to_db(db, insights: BrandContext, url: str, body: bytes | None = None,
+               validators: dict | None = None, unchanged: set = frozenset(), catalog_complete: bool = False):
+    """Persist scraped insights for url (run through DBSession.run / run_db).
+
+    `body` is the serialized BrandContext if the caller already has it; it
+    is stored as-is so DB hits return the same bytes as the fresh scrape.
+    `validators` (url -> scraper.Validator) replace the brand's stored page
+    validators, and sections named in `unchanged` are not rewritten.
+    Stored products are only deleted when `catalog_complete` says the
+    scraped catalog is the store's whole catalog.
+    """
+    if body is None:
+        body = insights.model_dump_json().encode()
+    try:
+        # Check if brand already exists (avoid duplicate inserts)
+        existing_brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
+        if existing_brand:
+            brand = existing_brand
+            brand.name = insights.brand_name
+            brand.about = insights.about
+        else:
+            brand = models_db.Brand(
+                name=insights.brand_name,
+                url=url,
+                about=insights.about,
+            )
+            db.add(brand)
+            db.flush()  # brand.id is available
+
+        now = utcnow()
+        brand.scraped_at = now
+        brand.expires_at = next_expiry(now)
+        brand.snapshot = pack_snapshot(body)
+        brand.etag = body_etag(body)
+
+        # Products (only new / changed rows written, changes logged to product_changes)
+        if "product_catalog" not in unchanged:
+            upsert_products(db, brand.id, insights.product_catalog, now, complete=catalog_complete)
+
+        # Policies (if one already exists, update)
+        if insights.policies and "policies" not in unchanged:
+            policy = db.query(models_db.PolicyDB).filter(models_db.PolicyDB.brand_id == brand.id).first()
+            if policy:
+                policy.privacy_policy = insights.policies.privacy_policy
+                policy.return_policy = insights.policies.return_policy
+            else:
+                db.add(models_db.PolicyDB(
+                    privacy_policy=insights.policies.privacy_policy,
+                    return_policy=insights.policies.return_policy or "",
+                    brand_id=brand.id
+                ))
+
+        # Contact
+        if insights.contact and "contact" not in unchanged:
+            contact = db.query(models_db.ContactDB).filter(models_db.ContactDB.brand_id == brand.id).first()
+            if contact:
+                contact.emails = insights.contact.emails
+                contact.phones = insights.contact.phones
+                contact.address = getattr(insights.contact, "address", None)
+            else:
+                db.add(models_db.ContactDB(
+                    emails=insights.contact.emails if hasattr(insights.contact, "emails") else [],
+                    phones=insights.contact.phones if hasattr(insights.contact, "phones") else [],
+                    address=getattr(insights.contact, "address", None),
+                    brand_id=brand.id
+                ))
+
+        if validators is not None:
+            save_validators(db, brand.id, validators)
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.exception("Failed to save to DB")
+        raise
+
+
+def get_scrape_state(db, url: str):
+    """(validators, previous serialized BrandContext) for a conditional re-scrape, or (None, None)"""
+    brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
+    if brand is None or brand.snapshot is None:
+        return None, None
+    rows = db.query(models_db.PageValidatorDB).filter(models_db.PageValidatorDB.brand_id == brand.id).all()
+    validators = {
+        r.url: Validator(r.section, r.etag, r.last_modified, r.content_hash)
+        for r in rows
+    }
+    return validators, unpack_snapshot(brand.snapshot)
+
+
+def save_validators(db, brand_id: int, validators: dict):
+    """Replace a brand's page validators (one DELETE + one executemany INSERT)"""
+    now = utcnow()
+    db.execute(delete(models_db.PageValidatorDB).where(models_db.PageValidatorDB.brand_id == brand_id))
+    if validators:
+        db.execute(
+            insert(models_db.PageValidatorDB),
+            [
+                {
+                    "brand_id": brand_id,
+                    "url": url[:512],
+                    "section": v.section,
+                    "etag": (v.etag or "")[:255] or None,
+                    "last_modified": (v.last_modified or "")[:64] or None,
+                    "content_hash": v.content_hash,
+                    "fetched_at": now,
+                }
+                for url, v in validators.items()
+            ],
+        )
+
+
+def touch_brand(db, url: str, validators: dict | None = None):
+    """Mark a brand as freshly scraped without rewriting anything (nothing changed)"""
+    try:
+        brand = db.query(models_db.Brand).filter(models_db.Brand.url == url).first()
+        if brand is None:
+            return
+        now = utcnow()
+        brand.scraped_at = now
+        brand.expires_at = next_expiry(now)
+        if validators is not None:
+            save_validators(db, brand.id, validators)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to touch brand in DB")
+        raise
+
+
+def get_competitors_from_db(db, base_url: str):
+    """Unexpired competitor lookup for base_url, or None"""
+    row = db.query(models_db.CompetitorDB).filter(models_db.CompetitorDB.base_url == base_url).first()
+    if not row or row.expires_at is None or row.expires_at <= utcnow():
+        return None
+    return row.competitors, row.source, row.expires_at
+
+
+def save_competitors_to_db(db, base_url: str, competitors: list[str], source: str, ttl: int):
+    try:
+        row = db.query(models_db.CompetitorDB).filter(models_db.CompetitorDB.base_url == base_url).first()
+        if row is None:
+            row = models_db.CompetitorDB(base_url=base_url)
+            db.add(row)
+        now = utcnow()
+        row.competitors = competitors
+        row.source = source
+        row.fetched_at = now
+        row.expires_at = now + timedelta(seconds=ttl)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to save competitors to DB")
+        raise
+
+
+def get_due_brands(db, limit: int, horizon: int = 0) -> list[tuple]:
+    """(url, expires_at, hits) of brands due for a refresh within `horizon` seconds"""
+    due = utcnow() + timedelta(seconds=horizon)
+    Brand = models_db.Brand
+    return [
+        tuple(row)
+        for row in db.query(Brand.url, Brand.expires_at, Brand.hits)
+        .filter((Brand.expires_at == None) | (Brand.expires_at <= due))  # noqa: E711
+        .order_by(Brand.expires_at)
+        .limit(limit)
+        .all()
+    ]
+
+
+def defer_brand(db, url: str, seconds: float):
+    """Make a brand due again in `seconds` (after a failed refresh)"""
+    try:
+        db.execute(
+            update(models_db.Brand.__table__)
+            .where(models_db.Brand.__table__.c.url == url)
+            .values(expires_at=utcnow() + timedelta(seconds=seconds))
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def get_hot_brands(db, limit: int) -> list[str]:
+    """URLs of the most requested brands (by brands.hits), for cache warmup"""
+    Brand = models_db.Brand
+    return [url for (url,) in db.query(Brand.url).order_by(Brand.hits.desc()).limit(limit).all()]
+
+
+def add_brand_hits(db, counts: dict[str, int]):
+    """Add buffered lookup counts to brands.hits (one executemany UPDATE)"""
+    if not counts:
+        return
+    try:
+        db.execute(
+            update(models_db.Brand.__table__)
+            .where(models_db.Brand.__table__.c.url == bindparam("b_url"))
+            .values(hits=models_db.Brand.__table__.c.hits + bindparam("b_hits")),
+            [{"b_url": url, "b_hits": n} for url, n in counts.items()],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to save brand hits")
+        raise
+
+
+def _job_dict(job) -> dict:
+    stamp = lambda dt: dt.isoformat() if dt else None
+    return {
+        "job_id": job.id,
+        "url": job.url,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": stamp(job.created_at),
+        "started_at": stamp(job.started_at),
+        "finished_at": stamp(job.finished_at),
+    }
+
+
+def enqueue_job(db, url: str, force_refresh: bool = False) -> dict:
+    """Queue a scrape of url, or return the job already queued / running for it"""
+    Job = models_db.ScrapeJob
+    try:
+        job = (
+            db.query(Job)
+            .filter(Job.url == url, Job.status.in_(("queued", "running")))
+            .order_by(Job.created_at)
+            .first()
+        )
+        if job is None:
+            job = Job(id=uuid.uuid4().hex, url=url, status="queued", force_refresh=force_refresh,
+                      attempts=0, created_at=utcnow())
+            db.add(job)
+            db.commit()
+        return _job_dict(job)
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to enqueue job")
+        raise
+
+
+def get_job(db, job_id: str) -> dict | None:
+    job = db.get(models_db.ScrapeJob, job_id)
+    return _job_dict(job) if job else None
+
+
+def claim_jobs(db, limit: int) -> list[tuple]:
+    """Mark up to `limit` queued jobs as running, oldest first; returns (id, url, force_refresh).
+
+    Each claim is a conditional UPDATE, so runners in several processes
+    never take the same job.
+    """
+    Job = models_db.ScrapeJob
+    try:
+        candidates = (
+            db.query(Job.id, Job.url, Job.force_refresh)
+            .filter(Job.status == "queued")
+            .order_by(Job.created_at)
+            .limit(limit)
+            .all()
+        )
+        now = utcnow()
+        claimed = []
+        for job_id, url, force_refresh in candidates:
+            result = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+            )
+            if result.rowcount:
+                claimed.append((job_id, url, force_refresh))
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to claim jobs")
+        raise
+
+
+def heartbeat_jobs(db, job_ids: list[str]):
+    """Tell other runners these jobs are still alive"""
+    if not job_ids:
+        return
+    Job = models_db.ScrapeJob
+    try:
+        db.execute(update(Job).where(Job.id.in_(job_ids), Job.status == "running").values(heartbeat_at=utcnow()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to heartbeat jobs")
+        raise
+
+
+def finish_job(db, job_id: str, error: str | None = None):
+    Job = models_db.ScrapeJob
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status="failed" if error else "done", error=error, finished_at=utcnow())
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to finish job")
+        raise
+
+
+def recover_jobs(db, lease_seconds: int, max_attempts: int, retention_seconds: int) -> int:
+    """Requeue running jobs whose runner stopped heartbeating (crash / restart).
+
+    Jobs that already used max_attempts are failed instead, and finished
+    jobs older than retention_seconds are deleted. Returns the number requeued.
+    """
+    Job = models_db.ScrapeJob
+    now = utcnow()
+    abandoned = (Job.status == "running") & (Job.heartbeat_at < now - timedelta(seconds=lease_seconds))
+    try:
+        db.execute(
+            update(Job)
+            .where(abandoned, Job.attempts >= max_attempts)
+            .values(status="failed", error=f"Gave up after {max_attempts} attempts", finished_at=now)
+        )
+        requeued = db.execute(update(Job).where(abandoned).values(status="queued")).rowcount
+        db.execute(
+            delete(Job).where(Job.status.in_(("done", "failed")), Job.finished_at < now - timedelta(seconds=retention_seconds))
+        )
+        db.commit()
+        return requeued
+    except Exception:
+        db.rollback()
+        logging.exception("Failed to recover jobs")
+        raise
+
+
+def get_product_changes(db, url: str, since: datetime, limit: int = 1000, after_id: int | None = None):
+    """(changes, next cursor) for a brand since `since`, oldest first; None if the brand is unknown.
+
+    Pass the returned cursor back as after_id for the next page.
+    """
+    brand_id = db.query(models_db.Brand.id).filter(models_db.Brand.url == url).scalar()
+    if brand_id is None:
+        return None
+    Change = models_db.ProductChange
+    query = db.query(Change).filter(Change.brand_id == brand_id, Change.changed_at >= since)
+    if after_id is not None:
+        query = query.filter(Change.id > after_id)
+    rows = query.order_by(Change.id).limit(limit).all()
+    changes = [
+        {
+            "handle": c.handle,
+            "variant_id": c.variant_id,
+            "change": c.change,
+            "old_price": None if c.old_price is None else str(c.old_price),
+            "new_price": None if c.new_price is None else str(c.new_price),
+            "old_available": c.old_available,
+            "new_available": c.new_available,
+            "changed_at": c.changed_at.isoformat(),
+        }
+        for c in rows
+    ]
+    return changes, (rows[-1].id if len(rows) == limit else None)
+
+
+class ProductQuery(NamedTuple):
+    """Filters of a product search"""
+    q: str | None = None                 # words that must all appear in the title or tags
+    brands: list[str] | None = None      # normalized store URLs
+    min_price: Decimal | None = None
+    max_price: Decimal | None = None
+    product_type: str | None = None
+    available: bool | None = None
+
+
+def _search_filters(db, query: ProductQuery) -> list:
+    Product = models_db.Product
+    filters = []
+    terms = re.findall(r"\w+", (query.q or "").lower())[:10]
+    if terms:
+        mysql = db.get_bind().dialect.name == "mysql"
+        # InnoDB skips words shorter than innodb_ft_min_token_size (3) in FULLTEXT
+        fulltext = [t for t in terms if mysql and len(t) >= 3]
+        if fulltext:
+            filters.append(
+                text("MATCH (products.title, products.tags) AGAINST (:ft IN BOOLEAN MODE)")
+                .bindparams(ft=" ".join(f"+{t}*" for t in fulltext))
+            )
+        for term in terms:
+            if term not in fulltext:
+                filters.append(or_(Product.title.icontains(term, autoescape=True),
+                                   Product.tags.icontains(term, autoescape=True)))
+    if query.brands:
+        filters.append(Product.brand_id.in_(select(models_db.Brand.id).where(models_db.Brand.url.in_(query.brands))))
+    if query.min_price is not None:
+        filters.append(Product.price >= query.min_price)
+    if query.max_price is not None:
+        filters.append(Product.price <= query.max_price)
+    if query.product_type:
+        filters.append(Product.product_type == query.product_type)
+    if query.available is not None:
+        filters.append(Product.available == query.available)
+    return filters
+
+
+def encode_cursor(price, product_id: int) -> str:
+    return f"{price}:{product_id}"
+
+
+# products.price is DECIMAL(12, 2)
+MAX_PRICE = Decimal("1e10")
+
+
+def decode_cursor(cursor: str) -> tuple[Decimal, int]:
+    """(price, id) of the last row of the previous page; ValueError if malformed or out of range"""
+    price, _, product_id = cursor.rpartition(":")
+    try:
+        value = Decimal(price)
+    except ArithmeticError:
+        raise ValueError(f"Bad cursor: {cursor}")
+    if not value.is_finite() or abs(value) >= MAX_PRICE:
+        raise ValueError(f"Bad cursor: {cursor}")
+    return value, int(product_id)
+
+
+def search_products(db, query: ProductQuery, sort: str = "price_asc", limit: int = 50, cursor: str | None = None):
+    """(products, next cursor) matching query across all stored brands.
+
+    Keyset-paginated on (price, id), so every page is an index range scan
+    no matter how deep; products without a price are not searchable.
+    """
+    Product, Brand = models_db.Product, models_db.Brand
+    descending = sort == "price_desc"
+    stmt = (
+        select(Product.id, Product.handle, Product.title, Product.price, Product.product_type,
+               Product.vendor, Product.available, Brand.url, Brand.name)
+        .join(Brand, Brand.id == Product.brand_id)
+        .where(Product.price.is_not(None), *_search_filters(db, query))
+    )
+    if cursor:
+        # Spelled out rather than a row comparison, which MySQL won't turn into an index range scan
+        price, product_id = decode_cursor(cursor)
+        if descending:
+            stmt = stmt.where(or_(Product.price < price, and_(Product.price == price, Product.id < product_id)))
+        else:
+            stmt = stmt.where(or_(Product.price > price, and_(Product.price == price, Product.id > product_id)))
+    order = (Product.price.desc(), Product.id.desc()) if descending else (Product.price, Product.id)
+    rows = db.execute(stmt.order_by(*order).limit(limit + 1)).all()
+
+    items = [
+        {
+            "brand_url": row.url,
+            "brand_name": row.name,
+            "handle": row.handle,
+            "title": row.title,
+            "url": f"{row.url}/products/{row.handle}",
+            "price": float(row.price),
+            "product_type": row.product_type,
+            "vendor": row.vendor,
+            "available": row.available,
+        }
+        for row in rows[:limit]
+    ]
+    next_cursor = encode_cursor(rows[limit - 1].price, rows[limit - 1].id) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def product_facets(db, query: ProductQuery) -> dict:
+    """Match counts per brand, product type and price range (top SEARCH_FACET_LIMIT each)"""
+    Product, Brand = models_db.Product, models_db.Brand
+    filters = [Product.price.is_not(None), *_search_filters(db, query)]
+    count = func.count(Product.id).label("n")
+
+    brands = db.execute(
+        select(Brand.url, Brand.name, count)
+        .join(Brand, Brand.id == Product.brand_id)
+        .where(*filters)
+        .group_by(Brand.id, Brand.url, Brand.name)
+        .order_by(count.desc())
+        .limit(SEARCH_FACET_LIMIT)
+    ).all()
+    types = db.execute(
+        select(Product.product_type, count)
+        .where(*filters, Product.product_type.is_not(None))
+        .group_by(Product.product_type)
+        .order_by(count.desc())
+        .limit(SEARCH_FACET_LIMIT)
+    ).all()
+
+    bounds = [0, *SEARCH_PRICE_RANGES]
+    labels = [f"{lo}-{hi}" for lo, hi in zip(bounds, bounds[1:])] + [f"{bounds[-1]}+"]
+    bucket = case(
+        *((Product.price < hi, label) for hi, label in zip(SEARCH_PRICE_RANGES, labels)),
+        else_=labels[-1],
+    ).label("bucket")
+    ranges = dict(db.execute(select(bucket, count).where(*filters).group_by(bucket)).all())
+
+    return {
+        "brands": [{"url": url, "name": name, "count": n} for url, name, n in brands],
+        "product_types": [{"value": value, "count": n} for value, n in types],
+        "price_ranges": [{"range": label, "count": ranges.get(label, 0)} for label in labels],
+    }
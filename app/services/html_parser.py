@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import os
+import re
+from typing import NamedTuple
+from bs4 import BeautifulSoup
+from lxml import etree
+from app.services import metrics
+
+# auto (selectolax if installed, else lxml) / selectolax / lxml / bs4
+HTML_PARSER = os.getenv("HTML_PARSER", "auto")
+# Documents larger than this are parsed in a worker thread, off the event loop
+PARSE_OFFLOAD_BYTES = int(os.getenv("PARSE_OFFLOAD_BYTES", "100000"))
+
+
+class ParsedPage(NamedTuple):
+    title: str | None
+    links: list[tuple[str, str]]   # (href, stripped link text) for every <a href>
+
+
+class Bs4Backend:
+    """Reference implementation; slowest, kept as the fallback"""
+    name = "bs4"
+
+    def parse_page(self, html: str) -> ParsedPage:
+        soup = BeautifulSoup(html, "lxml")
+        title = soup.title.string if soup.title else None
+        return ParsedPage(title, [(a["href"], a.get_text(strip=True)) for a in soup.find_all("a", href=True)])
+
+
+class LxmlBackend:
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+        self._html = lxml.html
+        self._element = etree.Element
+
+    def _doc(self, html: str):
+        if not html.strip():
+            return None
+        try:
+            return self._html.document_fromstring(html)
+        except ValueError:  # str with an XML encoding declaration
+            return self._html.document_fromstring(html.encode())
+
+    def _text(self, node, sep: str = "") -> str:
+        # Same as bs4 get_text(sep, strip=True): element text only, each piece stripped
+        return sep.join(t.strip() for t in node.itertext(self._element) if t.strip())
+
+    def parse_page(self, html: str) -> ParsedPage:
+        doc = self._doc(html)
+        if doc is None:
+            return ParsedPage(None, [])
+        title_node = doc.find(".//title")
+        title = title_node.text if title_node is not None else None
+        links = [(a.get("href"), self._text(a)) for a in doc.iter("a") if a.get("href") is not None]
+        return ParsedPage(title, links)
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:  # selectolax < 0.3.13
+            from selectolax.parser import HTMLParser
+        self._parser = HTMLParser
+
+    def parse_page(self, html: str) -> ParsedPage:
+        tree = self._parser(html)
+        title_node = tree.css_first("title")
+        title = title_node.text() if title_node is not None else None
+        links = [(a.attributes["href"], a.text(strip=True)) for a in tree.css("a[href]")]
+        return ParsedPage(title, [(href, text) for href, text in links if href is not None])
+
+
+BACKENDS = {"selectolax": SelectolaxBackend, "lxml": LxmlBackend, "bs4": Bs4Backend}
+
+
+def get_backend(name: str = HTML_PARSER):
+    order = ["selectolax", "lxml", "bs4"] if name == "auto" else [name, "bs4"]
+    for candidate in order:
+        try:
+            return BACKENDS[candidate]()
+        except (ImportError, KeyError):
+            if name != "auto":
+                logging.warning("HTML parser %r unavailable, falling back", candidate)
+    return Bs4Backend()
+
+
+backend = get_backend()
+
+
+def parse_page(html: str) -> ParsedPage:
+    return backend.parse_page(html)
+
+
+# Sub-page text (contact / about / FAQ) is extracted by streaming the HTML
+# through an lxml parser target instead: no tree is built, script / style
+# contents are dropped, and parsing stops as soon as the caller has enough.
+SKIP_TEXT_TAGS = frozenset({"script", "style", "noscript", "template"})
+FEED_CHUNK_CHARS = 64 * 1024
+_LINE_BREAK = re.compile(r"\r\n?|\n")
+
+
+class Enough(Exception):
+    """Raised from a TextTarget callback to stop parsing"""
+
+
+class TextTarget:
+    """lxml parser target that only sees tags and visible text nodes.
+
+    Subclasses override on_start / on_end / on_text / result. Text is
+    buffered until the next tag, so on_text always gets whole text nodes.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self._skipping = 0
+        self._pending = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        self.depth += 1
+        if tag in SKIP_TEXT_TAGS:
+            self._skipping += 1
+        self.on_start(tag, attrib)
+
+    def end(self, tag):
+        self._flush()
+        self.on_end(tag)
+        if tag in SKIP_TEXT_TAGS:
+            self._skipping -= 1
+        self.depth -= 1
+
+    def data(self, data):
+        if not self._skipping:
+            self._pending.append(data)
+
+    def close(self):
+        self._flush()
+        return self.result()
+
+    def _flush(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending.clear()
+            self.on_text(text)
+
+    def on_start(self, tag, attrib):
+        pass
+
+    def on_end(self, tag):
+        pass
+
+    def on_text(self, text: str):
+        pass
+
+    def result(self):
+        return None
+
+
+def stream_text(html: str, target: TextTarget):
+    """Feed html through target chunk by chunk; returns target.result(), early if it raised Enough"""
+    parser = etree.HTMLParser(target=target)
+    try:
+        for i in range(0, len(html), FEED_CHUNK_CHARS):
+            parser.feed(html[i:i + FEED_CHUNK_CHARS])
+        return parser.close()
+    except Enough:
+        return target.result()
+
+
+class _MainText(TextTarget):
+    """Like bs4 (soup.find("main") or soup.find("div", class_="rte") or soup).get_text(" ", strip=True)[:limit]"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.parts = {"main": [], "rte": [], "page": []}
+        self.sizes = dict.fromkeys(self.parts, 0)
+        self.open_at = {}        # region -> depth of its element while open
+        self.seen = set()
+
+    def on_start(self, tag, attrib):
+        if tag == "main" and "main" not in self.seen:
+            region = "main"
+        elif tag == "div" and "rte" not in self.seen and "rte" in (attrib.get("class") or "").split():
+            region = "rte"
+        else:
+            return
+        self.seen.add(region)
+        self.open_at[region] = self.depth
+
+    def on_end(self, tag):
+        for region, depth in list(self.open_at.items()):
+            if depth == self.depth:
+                del self.open_at[region]
+                if region == "main":
+                    raise Enough
+
+    def on_text(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        for region in ("page", *self.open_at):
+            if self.sizes[region] < self.limit:
+                self.parts[region].append(text)
+                self.sizes[region] += len(text) + 1
+        if "main" in self.open_at and self.sizes["main"] >= self.limit:
+            raise Enough
+
+    def result(self) -> str:
+        region = "main" if "main" in self.seen else "rte" if "rte" in self.seen else "page"
+        return " ".join(self.parts[region])[:self.limit]
+
+
+def main_text(html: str, limit: int = 1000) -> str:
+    """Text of <main> (or div.rte, or the whole page), cut at limit"""
+    return stream_text(html, _MainText(limit))
+
+
+class _Lines(TextTarget):
+    def __init__(self):
+        super().__init__()
+        self.ready = []
+        self._line = []
+
+    def on_text(self, text: str):
+        first, *rest = _LINE_BREAK.split(text)
+        self._line.append(first)
+        for part in rest:
+            self.ready.append(" ".join(self._line))
+            self._line = [part]
+
+    def result(self):
+        if self._line:
+            self.ready.append(" ".join(self._line))
+            self._line = []
+
+
+def iter_text_lines(html: str, limit: int):
+    """Lines of visible text (text nodes joined by " ", as bs4 get_text(" ") does).
+
+    Parsed lazily as the caller iterates; stops after about `limit` characters.
+    """
+    target = _Lines()
+    parser = etree.HTMLParser(target=target)
+    seen = 0
+    for i in range(0, len(html), FEED_CHUNK_CHARS):
+        parser.feed(html[i:i + FEED_CHUNK_CHARS])
+        lines, target.ready = target.ready, []
+        for line in lines:
+            yield line
+            seen += len(line) + 1
+            if seen >= limit:
+                return
+    parser.close()
+    yield from target.ready
+
+
+async def offload(fn, html: str, *args):
+    """Run a parse function, in a worker thread when the document is large"""
+    with metrics.span("parse"):
+        if len(html) > PARSE_OFFLOAD_BYTES:
+            return await asyncio.to_thread(fn, html, *args)
+        return fn(html, *args)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.services import metrics, politeness
+
+# Pool tuning (all overridable from .env)
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP2 = os.getenv("HTTP2", "0") == "1"
+
+# Max in-flight requests to a single host, so fanning out across many stores
+# never opens hundreds of sockets to one Shopify edge
+PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "6"))
+
+# Retry on throttling / server errors with exponential backoff + jitter
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+MAX_RETRY_DELAY = float(os.getenv("HTTP_MAX_RETRY_DELAY", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+# Pool saturation: requests on the wire vs. queued behind a per-host limit
+_in_flight = 0
+_waiting = 0
+
+
+def _http2_available() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logging.warning("HTTP2=1 but the 'h2' package is missing (pip install httpx[http2]); using HTTP/1.1")
+        return False
+    return True
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start():
+    """Create the application-wide client (called from the FastAPI lifespan)"""
+    global _client
+    if _client is None:
+        _client = _new_client()
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client; created lazily when used outside the app (scripts, workers)"""
+    global _client
+    if _client is None:
+        _client = _new_client()
+    return _client
+
+
+def host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc.lower()
+    sem = _host_limits.get(host)
+    if sem is None:
+        sem = _host_limits[host] = asyncio.Semaphore(PER_HOST_LIMIT)
+    return sem
+
+
+def _retry_after(resp: httpx.Response) -> float | None:
+    """Seconds to wait according to a Retry-After header (delta or HTTP date)"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+async def _send_capped(client: httpx.AsyncClient, method: str, url: str, max_bytes: int, **kwargs) -> httpx.Response:
+    """client.request that stops downloading the body after max_bytes (the rest is dropped)"""
+    resp = await client.send(client.build_request(method, url, **kwargs), stream=True)
+    chunks, size = [], 0
+    try:
+        async for chunk in resp.aiter_bytes():
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                logging.debug("Truncated %s at %d bytes", url, max_bytes)
+                break
+    finally:
+        await resp.aclose()
+    # Body is already decoded, so drop the headers describing the wire format
+    headers = [(k, v) for k, v in resp.headers.multi_items() if k.lower() not in ("content-encoding", "content-length")]
+    return httpx.Response(resp.status_code, headers=headers, content=b"".join(chunks)[:max_bytes],
+                          request=resp.request, extensions=resp.extensions)
+
+
+def _backoff(attempt: int) -> float:
+    return BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random())
+
+
+async def request(method: str, url: str, max_bytes: int | None = None, polite: bool = False,
+                  **kwargs) -> httpx.Response:
+    """Send a request through the shared pool with per-host limits and retries.
+
+    429 / 5xx responses and transport errors are retried up to MAX_RETRIES
+    times; the last response is returned as-is so callers keep deciding
+    whether to raise_for_status. With max_bytes, at most that much of the
+    body is downloaded.
+
+    polite=True (store scraping) also checks robots.txt, raising
+    politeness.RobotsDisallowed, paces the host with its token bucket and
+    takes a SCRAPE_MAX_CONNECTIONS slot; 429 / 503 slow the host down.
+    """
+    global _in_flight, _waiting
+    client = get_client()
+    sem = host_semaphore(url)
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    domain = None
+    if polite:
+        await politeness.check_robots(url, f"{parts.scheme}://{parts.netloc}", host, get)
+        domain = politeness.domain(host)
+    attempt = 0
+    while True:
+        _waiting += 1
+        try:
+            if domain is not None:
+                await domain.bucket.acquire()
+            await sem.acquire()
+            if domain is not None:
+                # Last, so requests queued behind one busy host never hold a global slot
+                try:
+                    await politeness.global_slots.acquire()
+                except BaseException:
+                    sem.release()
+                    raise
+        finally:
+            _waiting -= 1
+        try:
+            _in_flight += 1
+            start = time.perf_counter()
+            try:
+                if max_bytes is None:
+                    resp = await client.request(method, url, **kwargs)
+                else:
+                    resp = await _send_capped(client, method, url, max_bytes, **kwargs)
+            except httpx.TransportError:
+                metrics.upstream_seconds.observe(time.perf_counter() - start, host, "error")
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = _backoff(attempt)
+            else:
+                metrics.upstream_seconds.observe(time.perf_counter() - start, host, resp.status_code)
+                retry_after = _retry_after(resp)
+                if domain is not None:
+                    domain.observe(resp.status_code, retry_after and min(retry_after, MAX_RETRY_DELAY))
+                if resp.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                    return resp
+                delay = retry_after if retry_after is not None else _backoff(attempt)
+                await resp.aclose()
+        finally:
+            _in_flight -= 1
+            sem.release()
+            if domain is not None:
+                politeness.global_slots.release()
+
+        # Sleep outside the semaphore so other requests to the host can proceed
+        attempt += 1
+        await asyncio.sleep(min(delay, MAX_RETRY_DELAY))
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+def pool_stats() -> dict:
+    return {("in_flight",): _in_flight, ("waiting_for_host",): _waiting, ("max_connections",): MAX_CONNECTIONS}
+
+
+metrics.gauge("http_pool_requests", "Upstream HTTP requests in flight / queued behind HTTP_PER_HOST_LIMIT, and the pool size",
+              pool_stats, labels=("stat",))
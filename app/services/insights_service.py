@@ -0,0 +1,408 @@
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from app.models import BrandContext, Policy, Contact, Links, FAQ
+from app.services import metrics, scraper
+from app.services.cache import CacheEntry, LRUCache, SingleFlight, body_etag
+from app.services.db_service import (
+    CachedBrand, add_brand_hits, get_cached_brand, get_cached_brands, get_hot_brands, get_scrape_state, save_to_db,
+    touch_brand, utcnow,
+)
+from app.services.shared_cache import open_shared_cache
+from app.db import run_db
+
+# In-memory front cache of serialized BrandContext responses, keyed by normalized URL
+response_cache = LRUCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("CACHE_TTL_SECONDS", "300")),
+)
+
+metrics.register_cache("response", response_cache)
+
+# Cross-process L2 behind the LRU (SHARED_CACHE_PATH), None when disabled
+shared_cache = open_shared_cache()
+if shared_cache is not None:
+    metrics.register_cache("shared", shared_cache)
+
+# Brands loaded into the cache at startup, most requested first (0 = no warmup)
+CACHE_WARMUP_BRANDS = int(os.getenv("CACHE_WARMUP_BRANDS", "0"))
+WARMUP_BATCH_SIZE = 200
+
+# Concurrent requests for the same store share one DB load / one scrape
+inflight = SingleFlight()
+
+# Global cap on stores scraped at once by batch / fan-out requests
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))
+_scrape_slots = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+
+# Lookups per store since the last flush to brands.hits (refresh priority, warmup order)
+_hits: Counter = Counter()
+# How often each API process writes its buffered lookups to brands.hits
+HITS_FLUSH_SECONDS = float(os.getenv("HITS_FLUSH_SECONDS", "60"))
+
+# url -> running background refresh (one per store at a time)
+_refreshing: dict[str, asyncio.Task] = {}
+
+
+def build_brand_context(results: dict) -> BrandContext:
+    """Assemble a BrandContext from scraper.scrape_store output"""
+    policies = results.get("policies")
+    faqs = results.get("faqs")
+    contact = results.get("contact")
+    links = results.get("links")
+    return BrandContext(
+        brand_name=results.get("brand_name"),
+        product_catalog=results.get("product_catalog") or [],
+        hero_products=results.get("hero_products") or [],
+        policies=Policy(**policies) if policies else Policy(),
+        faqs=[FAQ(**f) for f in faqs] if faqs else [],
+        social_handles=results.get("social_handles") or {},
+        contact=Contact(**contact) if contact else Contact(),
+        about=results.get("about"),
+        links=Links(**links) if links else Links(),
+    )
+
+
+async def scrape_insights(url: str) -> BrandContext:
+    """Scrape a store (extractors run concurrently on one shared homepage)"""
+    results = await scraper.scrape_store(url)
+    return build_brand_context(results)
+
+
+def serialize(insights: BrandContext) -> bytes:
+    return insights.model_dump_json().encode()
+
+
+def _remember(url: str, entry: CacheEntry):
+    response_cache.set(url, entry)
+    if shared_cache is not None:
+        shared_cache.set(url, entry)
+
+
+def _fresh_enough(scraped_at, max_age: int | None) -> bool:
+    if max_age is None:
+        return True
+    if scraped_at is None:
+        return False
+    return (utcnow() - scraped_at).total_seconds() <= max_age
+
+
+async def _scrape_and_save(url: str) -> bytes:
+    # Re-scrapes send conditional requests and reuse every unchanged section
+    validators, previous_body = await run_db(get_scrape_state, url)
+    previous = json.loads(previous_body) if previous_body else None
+    with metrics.span("scrape"):
+        outcome = await scraper.rescrape_store(url, validators, previous)
+
+    if previous is not None and outcome.unchanged >= set(scraper.EXTRACTORS):
+        # Nothing changed since the last scrape: only bump the timestamps
+        body = previous_body
+        await run_db(touch_brand, url, outcome.validators)
+    else:
+        with metrics.span("serialize"):
+            insights = build_brand_context(outcome.results)
+            body = serialize(insights)
+        await run_db(save_to_db, insights, url, body, outcome.validators, outcome.unchanged, outcome.catalog_complete)
+
+    _remember(url, CacheEntry(body, utcnow(), body_etag(body)))
+    return body
+
+
+def _scrape_once(url: str):
+    if shared_cache is None:
+        return _scrape_and_save(url)
+    # Other worker processes scraping this store hand us their result instead
+    return shared_cache.produce_once(url, lambda: _scrape_and_save(url), utcnow())
+
+
+async def scrape_and_save(url: str) -> bytes:
+    """Scrape + save url, sharing the work with any scrape already running for it"""
+    return await inflight.do(("scrape", url), lambda: _scrape_once(url))
+
+
+async def refresh_brand(url: str) -> bytes:
+    """Re-scrape a store and save it, outside of any request"""
+    return await scrape_and_save(url)
+
+
+def _accept_cached(url: str, cached: CachedBrand | None, max_age: int | None) -> CacheEntry | None:
+    """Cache entry for a DB row if it satisfies max_age (scheduling a refresh when stale)"""
+    if not cached or not _fresh_enough(cached.scraped_at, max_age):
+        return None
+    # Stale-while-revalidate: answer from the DB, refresh in the background
+    if max_age is None and cached.is_stale():
+        schedule_refresh(url)
+    entry = CacheEntry(cached.body, cached.scraped_at, cached.etag)
+    _remember(url, entry)
+    return entry
+
+
+def _accept_shared(url: str, entry: CacheEntry | None, max_age: int | None) -> CacheEntry | None:
+    if entry is None or not _fresh_enough(entry.scraped_at, max_age):
+        return None
+    response_cache.set(url, entry)
+    return entry
+
+
+async def _scraped(url: str, scrape) -> CacheEntry:
+    body = await scrape(url)
+    return CacheEntry(body, utcnow(), body_etag(body))
+
+
+async def _load(url: str, max_age: int | None, scrape) -> CacheEntry:
+    if shared_cache is not None:
+        entry = _accept_shared(url, await shared_cache.get(url), max_age)
+        if entry is not None:
+            return entry
+    cached = await run_db(get_cached_brand, url)
+    entry = _accept_cached(url, cached, max_age)
+    if entry is not None:
+        return entry
+    # Not stored, or too old for this caller → scrape now
+    return await _scraped(url, scrape)
+
+
+async def get_insights_entry(url: str, max_age: int | None = None, force_refresh: bool = False,
+                             limited: bool = False) -> CacheEntry:
+    """Serialized BrandContext for a normalized store URL, with its ETag.
+
+    Order of lookups: in-memory LRU, the shared L2 cache (if enabled), then
+    the DB (one row holding the precomputed snapshot and ETag), then a live
+    scrape.
+    Concurrent callers for the same URL share one DB load / scrape.
+    With limited=True a scrape waits for a global SCRAPE_CONCURRENCY slot
+    (used by fan-out requests).
+    """
+    _hits[url] += 1
+    scrape = scrape_limited if limited else scrape_and_save
+    if force_refresh:
+        return await _scraped(url, scrape)
+    entry = response_cache.get(url)
+    if entry is not None and _fresh_enough(entry.scraped_at, max_age):
+        return entry
+    return await inflight.do(("load", url, max_age), lambda: _load(url, max_age, scrape))
+
+
+async def get_insights(url: str, max_age: int | None = None, force_refresh: bool = False, limited: bool = False) -> bytes:
+    """Serialized BrandContext for a normalized store URL (see get_insights_entry)"""
+    entry = await get_insights_entry(url, max_age=max_age, force_refresh=force_refresh, limited=limited)
+    return entry.body
+
+
+async def settle_insights(url: str, **kwargs):
+    """(url, body, error) instead of raising, for fan-out callers"""
+    try:
+        return url, await get_insights(url, limited=True, **kwargs), None
+    except Exception as e:
+        return url, None, e
+
+
+def _variant_prices(product: dict) -> list[float]:
+    values = [v.get("price") for v in product.get("variants") or []] or [product.get("price")]
+    prices = []
+    for value in values:
+        try:
+            prices.append(float(value))
+        except (TypeError, ValueError):
+            pass
+    return prices
+
+
+def slim_product(product: dict) -> dict:
+    """id, title, handle and price range of a raw Shopify product"""
+    prices = _variant_prices(product)
+    return {
+        "id": product.get("id"),
+        "title": product.get("title"),
+        "handle": product.get("handle") or product.get("url"),
+        "min_price": min(prices) if prices else None,
+        "max_price": max(prices) if prices else None,
+    }
+
+
+def shape_response(body: bytes, fields: list[str] | None = None, product_limit: int | None = None,
+                   product_offset: int = 0, slim_products: bool = False) -> bytes:
+    """Project / page a serialized BrandContext. Returns body untouched when nothing is asked for."""
+    if not fields and product_limit is None and not product_offset and not slim_products:
+        return body
+    data = json.loads(body)
+    if fields:
+        data = {k: data[k] for k in fields if k in data}
+    catalog = data.get("product_catalog")
+    if catalog is not None:
+        end = None if product_limit is None else product_offset + product_limit
+        page = catalog[product_offset:end]
+        data["product_catalog"] = [slim_product(p) for p in page] if slim_products else page
+        if product_limit is not None or product_offset:
+            data["product_catalog_total"] = len(catalog)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def shaped_etag(etag: str, fields: list[str] | None = None, product_limit: int | None = None,
+                product_offset: int = 0, slim_products: bool = False) -> str:
+    """ETag of shape_response(body, ...) derived from the body's ETag, without shaping it"""
+    if not fields and product_limit is None and not product_offset and not slim_products:
+        return etag
+    key = json.dumps([etag, fields, product_limit, product_offset, slim_products]).encode()
+    return body_etag(key)
+
+
+def catalog_summary(data: dict) -> dict:
+    """Catalog size and price range of a BrandContext dict, for comparisons"""
+    catalog = data.get("product_catalog") or []
+    prices = [price for p in catalog for price in _variant_prices(p) if price > 0]
+    return {
+        "brand_name": data.get("brand_name"),
+        "catalog_size": len(catalog),
+        "min_price": min(prices) if prices else None,
+        "max_price": max(prices) if prices else None,
+        "avg_price": round(sum(prices) / len(prices), 2) if prices else None,
+    }
+
+
+async def scrape_limited(url: str) -> bytes:
+    """scrape_and_save under the global SCRAPE_CONCURRENCY limit"""
+    async with _scrape_slots:
+        return await scrape_and_save(url)
+
+
+async def iter_insights(urls: list[str], max_age: int | None = None, force_refresh: bool = False):
+    """Yield (url, body, error) for many normalized URLs as each one completes.
+
+    LRU hits come out first, then shared L2 hits, then every DB hit from one IN query, then the
+    remaining stores are scraped concurrently under SCRAPE_CONCURRENCY.
+    A failed store yields its error instead of stopping the batch.
+    """
+    pending = []
+    for url in dict.fromkeys(urls):
+        _hits[url] += 1
+        entry = None if force_refresh else response_cache.get(url)
+        if entry is not None and _fresh_enough(entry.scraped_at, max_age):
+            yield url, entry.body, None
+        else:
+            pending.append(url)
+
+    if pending and not force_refresh and shared_cache is not None:
+        shared = await shared_cache.get_many(pending)
+        misses = []
+        for url in pending:
+            entry = _accept_shared(url, shared.get(url), max_age)
+            if entry is not None:
+                yield url, entry.body, None
+            else:
+                misses.append(url)
+        pending = misses
+
+    if pending and not force_refresh:
+        cached = await run_db(get_cached_brands, pending)
+        misses = []
+        for url in pending:
+            entry = _accept_cached(url, cached.get(url), max_age)
+            if entry is not None:
+                yield url, entry.body, None
+            else:
+                misses.append(url)
+        pending = misses
+
+    async def _one(url):
+        try:
+            return url, await scrape_limited(url), None
+        except Exception as e:
+            return url, None, e
+
+    tasks = [asyncio.create_task(_one(url)) for url in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def warm_cache(limit: int = CACHE_WARMUP_BRANDS) -> int:
+    """Load the `limit` most requested brands into the cache (L2 first, then the DB)"""
+    limit = min(limit, response_cache.max_entries)
+    if limit <= 0:
+        return 0
+    loaded = 0
+    try:
+        urls = await run_db(get_hot_brands, limit)
+        for i in range(0, len(urls), WARMUP_BATCH_SIZE):
+            batch = urls[i:i + WARMUP_BATCH_SIZE]
+            shared = await shared_cache.get_many(batch) if shared_cache is not None else {}
+            for url, entry in shared.items():
+                response_cache.set(url, entry)
+            missing = [url for url in batch if url not in shared]
+            stored = await run_db(get_cached_brands, missing) if missing else {}
+            for url, cached in stored.items():
+                _remember(url, CacheEntry(cached.body, cached.scraped_at, cached.etag))
+            loaded += len(shared) + len(stored)
+    except Exception:
+        logging.exception("Cache warmup failed after %d brands", loaded)
+    else:
+        logging.info("Cache warmup loaded %d brands", loaded)
+    return loaded
+
+
+def drain_hits() -> dict[str, int]:
+    """Buffered lookup counts, reset on read"""
+    counts = dict(_hits)
+    _hits.clear()
+    return counts
+
+
+async def flush_hits():
+    """Add buffered lookups to brands.hits; they stay buffered if the write fails"""
+    counts = drain_hits()
+    try:
+        await run_db(add_brand_hits, counts)
+    except Exception:
+        _hits.update(counts)
+        raise
+
+
+async def flush_hits_forever(interval: float = HITS_FLUSH_SECONDS):
+    """Flush lookups every `interval` seconds, and once more when cancelled (shutdown)"""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_hits()
+            except Exception:
+                logging.warning("Flushing brand hits failed", exc_info=True)
+    finally:
+        try:
+            await flush_hits()
+        except Exception:
+            logging.warning("Flushing brand hits failed", exc_info=True)
+
+
+metrics.gauge("singleflight_coalesced", "Requests that joined an in-flight load / scrape instead of starting one",
+              lambda: inflight.coalesced)
+
+
+def cache_stats() -> dict:
+    """Counters of this worker process (pid); shared is the cross-process L2, when enabled"""
+    stats = {**response_cache.stats(), "coalesced": inflight.coalesced, "pid": os.getpid()}
+    if shared_cache is not None:
+        stats["shared"] = shared_cache.stats()
+    return stats
+
+
+def schedule_refresh(url: str) -> bool:
+    """Start a background refresh of url unless one is already running"""
+    if url in _refreshing:
+        return False
+    task = asyncio.create_task(refresh_brand(url))
+    _refreshing[url] = task
+    task.add_done_callback(lambda t: _refresh_done(url, t))
+    return True
+
+
+def _refresh_done(url: str, task: asyncio.Task):
+    _refreshing.pop(url, None)
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning("Background refresh of %s failed: %s", url, task.exception())
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import os
+import httpx
+from app.db import run_db
+from app.services import scraper
+from app.services.db_service import claim_jobs, finish_job, get_job, heartbeat_jobs, recover_jobs
+from app.services.insights_service import get_insights
+
+# Scrape jobs run at once per process (scrapes also count against SCRAPE_CONCURRENCY)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# How often idle runners look for queued jobs (new jobs in this process wake them at once)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job whose runner hasn't heartbeated for this long is requeued
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Run jobs inside the API process (otherwise only `python -m app.worker` runs them)
+JOBS_IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "1") == "1"
+# How often a stream re-reads a job that runs in another process
+JOB_STREAM_POLL_SECONDS = float(os.getenv("JOB_STREAM_POLL_SECONDS", "1"))
+
+
+def ndjson(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode() + b"\n"
+
+
+def result_line(job_id: str, body: bytes) -> bytes:
+    # body is already BrandContext JSON, spliced in without re-encoding
+    return b'{"job_id":' + json.dumps(job_id).encode() + b',"status":"done","result":' + body + b"}\n"
+
+
+def error_detail(error: Exception) -> str:
+    return "Website not found" if isinstance(error, httpx.HTTPStatusError) else str(error)
+
+
+class JobProgress:
+    """NDJSON lines of a job running in this process, replayed to every stream reader"""
+
+    def __init__(self):
+        self.lines: list[bytes] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def push(self, line: bytes, done: bool = False):
+        self.lines.append(line)
+        self.done = self.done or done
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.lines):
+                yield self.lines[sent]
+                sent += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class JobRunner:
+    """Claims queued scrape jobs from the scrape_jobs table and runs them.
+
+    Up to `workers` jobs run at once. While a job runs the runner keeps
+    its heartbeat fresh; jobs left running by a process that died are
+    requeued by whichever runner notices first (after JOB_LEASE_SECONDS),
+    so queued work survives restarts.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.running: dict[str, asyncio.Task] = {}
+        self.progress: dict[str, JobProgress] = {}
+        self._wake = asyncio.Event()
+        self._started = asyncio.Event()
+        self.completed = 0
+        self.failed = 0
+
+    def wake(self):
+        """A job was queued: look now instead of waiting for the next poll"""
+        self._wake.set()
+
+    async def _execute(self, job_id: str, url: str, force_refresh: bool):
+        progress = self.progress[job_id] = JobProgress()
+        progress.push(ndjson({"job_id": job_id, "status": "running", "url": url}))
+        self._started.set()
+        self._started = asyncio.Event()
+        try:
+            # Sections stream out as the scrape produces them
+            with scraper.report_progress(lambda name, value: progress.push(ndjson({"section": name, "data": value}))):
+                body = await get_insights(url, force_refresh=force_refresh, limited=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            detail = error_detail(e)
+            logging.warning("Job %s (%s) failed: %s", job_id, url, detail)
+            # Readers first, so they never hang on a DB write that fails
+            progress.push(ndjson({"job_id": job_id, "status": "failed", "error": detail}), done=True)
+            await self._finish(job_id, detail)
+        else:
+            self.completed += 1
+            progress.push(result_line(job_id, body), done=True)
+            await self._finish(job_id)
+        finally:
+            self.progress.pop(job_id, None)
+
+    async def _finish(self, job_id: str, error: str | None = None):
+        try:
+            await run_db(finish_job, job_id, error)
+        except Exception as e:
+            # The row stays "running" until recover_jobs requeues it
+            logging.warning("Job %s could not be marked finished: %s", job_id, e)
+
+    def _start(self, job_id: str, url: str, force_refresh: bool):
+        task = asyncio.create_task(self._execute(job_id, url, force_refresh))
+        self.running[job_id] = task
+
+        def done(t: asyncio.Task):
+            self.running.pop(job_id, None)
+            self._wake.set()   # a slot is free
+            if not t.cancelled() and t.exception() is not None:
+                logging.warning("Job %s could not be finished: %s", job_id, t.exception())
+
+        task.add_done_callback(done)
+
+    async def _maintain(self):
+        await run_db(heartbeat_jobs, list(self.running))
+        requeued = await run_db(recover_jobs, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETENTION_SECONDS)
+        if requeued:
+            logging.info("Requeued %d abandoned jobs", requeued)
+
+    async def run(self):
+        """Claim and run jobs forever (until cancelled)"""
+        loop = asyncio.get_running_loop()
+        next_maintenance = 0.0
+        try:
+            while True:
+                try:
+                    if loop.time() >= next_maintenance:
+                        await self._maintain()
+                        next_maintenance = loop.time() + JOB_LEASE_SECONDS / 3
+                    free = self.workers - len(self.running)
+                    if free > 0:
+                        for job in await run_db(claim_jobs, free):
+                            self._start(*job)
+                except Exception:
+                    logging.exception("Job poll failed")
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Interrupted jobs stay "running" and are requeued once their lease runs out
+            for task in self.running.values():
+                task.cancel()
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.run())
+
+    async def wait_for_start(self, timeout: float):
+        """Return when any job starts in this process, or after timeout"""
+        try:
+            await asyncio.wait_for(self._started.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        return {"running": len(self.running), "completed": self.completed, "failed": self.failed}
+
+
+runner = JobRunner()
+
+
+async def follow_job(job: dict):
+    """NDJSON lines for /jobs/{id}/stream: status, each section as it's scraped, then the result.
+
+    Partial sections are only available while the job runs in this process;
+    otherwise the job row is polled and just the outcome is sent.
+    """
+    job_id = job["job_id"]
+    yield ndjson({"job_id": job_id, "status": job["status"], "url": job["url"]})
+    while True:
+        progress = runner.progress.get(job_id)
+        if progress is not None:
+            async for line in progress.follow():
+                yield line
+            return
+        if job["status"] not in ("queued", "running"):
+            break
+        await runner.wait_for_start(JOB_STREAM_POLL_SECONDS)
+        if job_id in runner.progress:
+            continue
+        job = await run_db(get_job, job_id)
+        if job is None:
+            return
+
+    if job["status"] == "failed":
+        yield ndjson({"job_id": job_id, "status": "failed", "error": job["error"]})
+        return
+    try:
+        # Saved by the job, so this is a cache / DB hit
+        yield result_line(job_id, await get_insights(job["url"]))
+    except Exception as e:
+        yield ndjson({"job_id": job_id, "status": "failed", "error": error_detail(e)})
@@ -0,0 +1,183 @@
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Add a Server-Timing header (per-stage durations) to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# Label every series with the process id, so the workers started by app.serve
+# (which sets this) show up as separate series instead of one that jumps around
+METRICS_PID_LABEL = os.getenv("METRICS_PID_LABEL", "0") == "1"
+PID = str(os.getpid())
+
+# Seconds; covers a cache hit (ms) up to a full catalog crawl (CATALOG_TIMEOUT)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Prometheus-style histogram with a fixed label set"""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[tuple, list] = {}
+        _histograms.append(self)
+
+    def observe(self, value: float, *label_values):
+        label_values = tuple(str(v) for v in label_values)
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            base = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if METRICS_PID_LABEL:
+        names, values = ("pid",) + names, (PID,) + tuple(values)
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+_histograms: list[Histogram] = []
+# name -> (help, label names, fn); fn is read at scrape time
+_gauges: dict[str, tuple] = {}
+# name -> LRUCache-like object with .stats()
+_caches: dict[str, object] = {}
+
+
+def gauge(name: str, help: str, fn, labels: tuple = ()):
+    """Register a gauge read on every /metrics scrape.
+
+    fn returns a number, or {label values tuple: number} when labels are given.
+    """
+    _gauges[name] = (help, labels, fn)
+
+
+def register_cache(name: str, cache):
+    """Expose an LRUCache's stats() as cache_* metrics labelled cache=name"""
+    _caches[name] = cache
+
+
+stage_seconds = Histogram("stage_seconds", "Time spent per pipeline stage (fetch, parse, extract, db)", ("stage",))
+extractor_seconds = Histogram("extractor_seconds", "Scraper extractor latency", ("extractor",))
+upstream_seconds = Histogram("upstream_seconds", "Upstream HTTP request latency per host", ("host", "status"))
+db_seconds = Histogram("db_seconds", "DB call latency per helper", ("op",))
+request_seconds = Histogram("request_seconds", "API request latency", ("method", "path", "status"))
+
+
+# stage -> seconds for the current API request (see ServerTiming)
+_timings: ContextVar[dict | None] = ContextVar("timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as `stage`: stage_seconds histogram + Server-Timing of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def server_timing(timings: dict, total: float) -> str:
+    # Concurrent stages overlap, so their durations can add up to more than total
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTiming:
+    """ASGI middleware: collects span() durations per request into a Server-Timing header
+    and records request_seconds."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    header = server_timing(timings, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            # Route template (e.g. /jobs/{job_id}) keeps the label set small
+            path = getattr(scope.get("route"), "path", scope["path"])
+            request_seconds.observe(time.perf_counter() - start, scope["method"], path, status)
+
+
+def _render_gauge(name: str, help: str, labels: tuple, value) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    if isinstance(value, dict):
+        lines += [f"{name}{_labels(labels, k)} {v}" for k, v in sorted(value.items())]
+    else:
+        lines.append(f"{name}{_labels((), ())} {value}")
+    return lines
+
+
+CACHE_GAUGES = {
+    "entries": "Entries in the in-memory cache",
+    "bytes": "Bytes held by the in-memory cache",
+    "hits": "Cache hits since start",
+    "misses": "Cache misses since start",
+    "evictions": "Cache evictions since start",
+    "hit_ratio": "hits / (hits + misses) since start",
+}
+
+
+def render() -> str:
+    """Everything in the Prometheus text exposition format"""
+    lines = []
+    for histogram in _histograms:
+        lines += histogram.render()
+    stats = {name: cache.stats() for name, cache in _caches.items()}
+    for key, help in CACHE_GAUGES.items():
+        lines += _render_gauge(f"cache_{key}", help, ("cache",), {(name,): s[key] for name, s in stats.items()})
+    for name, (help, labels, fn) in _gauges.items():
+        lines += _render_gauge(name, help, labels, fn())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+from urllib.robotparser import RobotFileParser
+from app.services import metrics
+from app.services.cache import SingleFlight
+
+# Per-domain request rate (token bucket): sustained requests/sec and burst size
+DOMAIN_RATE = float(os.getenv("DOMAIN_RATE", "4"))
+DOMAIN_BURST = float(os.getenv("DOMAIN_BURST", "8"))
+# On 429 / 503 a domain's rate is multiplied by this; each success adds DOMAIN_RECOVERY back
+DOMAIN_SLOWDOWN = float(os.getenv("DOMAIN_SLOWDOWN", "0.5"))
+DOMAIN_RECOVERY = float(os.getenv("DOMAIN_RECOVERY", "0.1"))
+DOMAIN_MIN_RATE = float(os.getenv("DOMAIN_MIN_RATE", "0.2"))
+# Scraper requests on the wire at once, across all stores
+SCRAPE_MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", "64"))
+
+RESPECT_ROBOTS = os.getenv("RESPECT_ROBOTS", "1") == "1"
+ROBOTS_USER_AGENT = os.getenv("ROBOTS_USER_AGENT", "*")
+ROBOTS_TTL_SECONDS = float(os.getenv("ROBOTS_TTL_SECONDS", "3600"))
+# robots.txt that could not be fetched (5xx / network) counts as "allow all" for this long
+ROBOTS_ERROR_TTL_SECONDS = float(os.getenv("ROBOTS_ERROR_TTL_SECONDS", "300"))
+ROBOTS_MAX_BYTES = 512 * 1024
+
+THROTTLE_STATUSES = {429, 503}
+MAX_DOMAINS = 10000
+
+
+class RobotsDisallowed(Exception):
+    """robots.txt forbids fetching this URL"""
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; waiters are served in arrival order"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0     # no tokens at all before this (Retry-After)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Domain:
+    """Rate state of one host: token bucket, slowed down on 429 / 503 and recovering on success"""
+
+    def __init__(self, rate: float = DOMAIN_RATE, burst: float = DOMAIN_BURST):
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.throttled = 0
+
+    def limit(self, rate: float):
+        """Cap the rate (e.g. robots.txt Crawl-delay)"""
+        self.max_rate = min(self.max_rate, rate)
+        self.bucket.rate = min(self.bucket.rate, rate)
+
+    def observe(self, status: int, retry_after: float | None = None):
+        bucket = self.bucket
+        if status in THROTTLE_STATUSES:
+            self.throttled += 1
+            # The floor never lifts a rate that robots.txt Crawl-delay set lower
+            bucket.rate = max(min(DOMAIN_MIN_RATE, self.max_rate), bucket.rate * DOMAIN_SLOWDOWN)
+            bucket.tokens = min(bucket.tokens, 0)
+            if retry_after:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+        elif status < 500 and bucket.rate < self.max_rate:
+            bucket.rate = min(self.max_rate, bucket.rate + DOMAIN_RECOVERY)
+
+
+class RobotsRules:
+    def __init__(self, parser: RobotFileParser | None, expires: float):
+        self.parser = parser        # None: everything allowed
+        self.expires = expires
+
+    def allowed(self, url: str) -> bool:
+        return self.parser is None or self.parser.can_fetch(ROBOTS_USER_AGENT, url)
+
+    def crawl_delay(self) -> float | None:
+        if self.parser is None:
+            return None
+        delay = self.parser.crawl_delay(ROBOTS_USER_AGENT)
+        return float(delay) if delay else None
+
+
+_domains: dict[str, Domain] = {}
+_robots: dict[str, RobotsRules] = {}
+_robots_inflight = SingleFlight()
+global_slots = asyncio.Semaphore(SCRAPE_MAX_CONNECTIONS)
+
+
+def domain(host: str) -> Domain:
+    state = _domains.get(host)
+    if state is None:
+        if len(_domains) >= MAX_DOMAINS:
+            _domains.pop(next(iter(_domains)))
+        state = _domains[host] = Domain()
+    return state
+
+
+async def _load_robots(origin: str, fetch) -> RobotsRules:
+    now = time.monotonic()
+    try:
+        resp = await fetch(f"{origin}/robots.txt", timeout=10, max_bytes=ROBOTS_MAX_BYTES)
+    except Exception as e:
+        logging.info("robots.txt for %s unavailable: %s", origin, e)
+        return RobotsRules(None, now + ROBOTS_ERROR_TTL_SECONDS)
+    if resp.status_code >= 500:
+        return RobotsRules(None, now + ROBOTS_ERROR_TTL_SECONDS)
+    if resp.status_code != 200:
+        # 4xx: no robots.txt, so no restrictions
+        return RobotsRules(None, now + ROBOTS_TTL_SECONDS)
+    parser = RobotFileParser()
+    parser.parse(resp.text.splitlines())
+    return RobotsRules(parser, now + ROBOTS_TTL_SECONDS)
+
+
+async def robots(origin: str, host: str, fetch) -> RobotsRules:
+    """Cached robots.txt rules for a scheme://host origin; fetch is http_client.request-like"""
+    rules = _robots.get(host)
+    if rules is None or rules.expires <= time.monotonic():
+        rules = await _robots_inflight.do(host, lambda: _load_robots(origin, fetch))
+        if len(_robots) >= MAX_DOMAINS:
+            _robots.pop(next(iter(_robots)))
+        _robots[host] = rules
+        delay = rules.crawl_delay()
+        if delay:
+            domain(host).limit(1 / delay)
+    return rules
+
+
+async def check_robots(url: str, origin: str, host: str, fetch):
+    """Raise RobotsDisallowed unless robots.txt lets us fetch url"""
+    if not RESPECT_ROBOTS or url == f"{origin}/robots.txt":
+        return
+    if not (await robots(origin, host, fetch)).allowed(url):
+        raise RobotsDisallowed(f"Disallowed by robots.txt: {url}")
+
+
+def stats() -> dict:
+    return {
+        ("domains",): len(_domains),
+        ("slowed_domains",): sum(1 for d in _domains.values() if d.bucket.rate < d.max_rate),
+        ("throttle_responses",): sum(d.throttled for d in _domains.values()),
+        ("robots_cached",): len(_robots),
+    }
+
+
+metrics.gauge("politeness", "Scraper politeness state: tracked / slowed-down domains, 429+503 seen, robots.txt cached",
+              stats, labels=("stat",))
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from urllib.parse import urlsplit
+from app.db import run_db
+from app.services.db_service import defer_brand, get_due_brands, utcnow
+from app.services.insights_service import flush_hits, refresh_brand
+
+# How often the scheduler looks for brands whose TTL (BRAND_TTL_SECONDS) ran out
+REFRESH_POLL_SECONDS = float(os.getenv("REFRESH_POLL_SECONDS", "300"))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "4"))
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "500"))
+# ± fraction applied to every poll interval
+REFRESH_JITTER = float(os.getenv("REFRESH_JITTER", "0.2"))
+# Minimum seconds between two refreshes of stores on the same host
+REFRESH_HOST_DELAY = float(os.getenv("REFRESH_HOST_DELAY", "5"))
+# Run the scheduler inside the API process (otherwise use `python -m app.worker`)
+REFRESH_IN_PROCESS = os.getenv("REFRESH_IN_PROCESS", "0") == "1"
+# A failed refresh is retried after REFRESH_RETRY_SECONDS, doubling per consecutive failure
+REFRESH_RETRY_SECONDS = float(os.getenv("REFRESH_RETRY_SECONDS", "600"))
+REFRESH_RETRY_MAX_SECONDS = float(os.getenv("REFRESH_RETRY_MAX_SECONDS", "86400"))
+
+
+def priority(expires_at, hits: int) -> float:
+    """Lower runs first: the more overdue and the more popular, the sooner"""
+    overdue = (utcnow() - expires_at).total_seconds() if expires_at else 86400.0
+    return -(max(overdue, 1.0) * (1 + math.log1p(hits or 0)))
+
+
+class RefreshScheduler:
+    """Re-scrapes tracked brands as their TTL runs out.
+
+    Every poll (jittered) flushes buffered hit counts, loads the due brands
+    and queues them by priority(); a bounded pool of workers drains the
+    queue, never refreshing two stores on the same host within
+    REFRESH_HOST_DELAY seconds.
+    """
+
+    def __init__(self, workers: int = REFRESH_WORKERS, poll_seconds: float = REFRESH_POLL_SECONDS,
+                 batch_size: int = REFRESH_BATCH_SIZE, host_delay: float = REFRESH_HOST_DELAY):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.host_delay = host_delay
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.queued: set[str] = set()
+        self._host_next: dict[str, float] = {}
+        self._host_locks: dict[str, asyncio.Lock] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._failures: dict[str, int] = {}   # url -> consecutive failed refreshes
+        self.refreshed = 0
+        self.failed = 0
+
+    async def poll(self):
+        """Queue every brand that is due, most urgent first"""
+        await flush_hits()
+        due = await run_db(get_due_brands, self.batch_size)
+        for url, expires_at, hits in due:
+            if url not in self.queued:
+                self.queued.add(url)
+                self.queue.put_nowait((priority(expires_at, hits), url))
+        return len(due)
+
+    async def _polite(self, url: str):
+        host = urlsplit(url).netloc
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._host_next.get(host, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._host_next[host] = time.monotonic() + self.host_delay
+
+    async def _worker(self):
+        while True:
+            _, url = await self.queue.get()
+            try:
+                await self._polite(url)
+                await refresh_brand(url)
+                self.refreshed += 1
+                self._failures.pop(url, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                await self._defer(url)
+                logging.warning("Scheduled refresh of %s failed: %s", url, e)
+            finally:
+                self.queued.discard(url)
+                self.queue.task_done()
+
+    async def _defer(self, url: str):
+        """Push a failed brand's expires_at out (with backoff) so every poll doesn't pick it up again"""
+        failures = self._failures[url] = self._failures.get(url, 0) + 1
+        delay = min(REFRESH_RETRY_SECONDS * 2 ** (failures - 1), REFRESH_RETRY_MAX_SECONDS)
+        try:
+            await run_db(defer_brand, url, delay)
+        except Exception:
+            logging.warning("Could not defer the refresh of %s", url, exc_info=True)
+
+    async def run(self):
+        """Poll forever (until cancelled)"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            # Stagger start-up so several processes don't poll in lockstep
+            await asyncio.sleep(random.uniform(0, self.poll_seconds * REFRESH_JITTER))
+            while True:
+                try:
+                    await self.poll()
+                except Exception:
+                    logging.exception("Refresh poll failed")
+                jitter = random.uniform(-REFRESH_JITTER, REFRESH_JITTER)
+                await asyncio.sleep(self.poll_seconds * (1 + jitter))
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.run())
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "refreshed": self.refreshed, "failed": self.failed}
@@ -1,107 +1,346 @@
-import httpx
 from bs4 import BeautifulSoup
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import logging
+import os
 import re
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+from app.services import html_parser, http_client, metrics
+
+# Per-extractor budgets; an extractor that runs over returns its empty default
+EXTRACTOR_TIMEOUT = float(os.getenv("EXTRACTOR_TIMEOUT", "20"))
+SUBPAGE_TIMEOUT = float(os.getenv("SUBPAGE_TIMEOUT", "30"))
+CATALOG_TIMEOUT = float(os.getenv("CATALOG_TIMEOUT", "60"))
+
+# Catalog pagination: Shopify serves at most 250 products per page
+PRODUCTS_PAGE_SIZE = 250
+MAX_PRODUCTS = int(os.getenv("MAX_PRODUCTS", "10000"))
+PRODUCT_PAGE_PREFETCH = int(os.getenv("PRODUCT_PAGE_PREFETCH", "3"))
+
+# Sub-pages (FAQ / contact / about): bytes downloaded at most, and text budgets
+SUBPAGE_MAX_BYTES = int(os.getenv("SUBPAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+CONTACT_TEXT_LIMIT = int(os.getenv("CONTACT_TEXT_LIMIT", "100000"))
+ABOUT_TEXT_LIMIT = int(os.getenv("ABOUT_TEXT_LIMIT", "1000"))
+FAQ_MAX_ITEMS = int(os.getenv("FAQ_MAX_ITEMS", "100"))
+
+def normalize_url(url: str) -> str:
+    """Canonical store URL used as the cache / DB key (https default, lowercase host, no trailing slash)"""
+    url = url.strip()
+    if not url.startswith("http"):
+        url = "https://" + url
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+class Validator(NamedTuple):
+    """What we know about a fetched URL, for conditional re-fetches"""
+    section: str | None          # homepage / products / faqs / contact / about
+    etag: str | None
+    last_modified: str | None
+    content_hash: str
+
+
+# url -> Validator for every page fetched by the current scrape (see track_fetches)
+_fetch_log: ContextVar[dict | None] = ContextVar("fetch_log", default=None)
+
+
+# Called as progress(name, result) whenever a section of the current scrape is ready
+_progress: ContextVar = ContextVar("progress", default=None)
+
+
+@contextmanager
+def report_progress(callback):
+    """Send each section of scrapes started inside this block to callback(name, result)"""
+    token = _progress.set(callback)
+    try:
+        yield
+    finally:
+        _progress.reset(token)
+
+
+def _report(name: str, result):
+    callback = _progress.get()
+    if callback is not None:
+        callback(name, result)
+
+
+def _record(url: str, resp, section: str | None) -> str:
+    content_hash = hashlib.sha256(resp.content).hexdigest()
+    log = _fetch_log.get()
+    if log is not None:
+        log[url] = Validator(section, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), content_hash)
+    return content_hash
+
+
+def _max_bytes(section: str | None) -> int | None:
+    return SUBPAGE_MAX_BYTES if section in SUBPAGES else None
+
 
-async def fetch_page(url: str):
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, timeout=15)
+async def fetch_page(url: str, section: str | None = None):
+    with metrics.span(f"fetch_{section or 'page'}"):
+        resp = await http_client.get(url, timeout=15, max_bytes=_max_bytes(section), polite=True)
+    resp.raise_for_status()
+    _record(url, resp, section)
+    return resp.text
+
+
+async def fetch_if_changed(url: str, previous: Validator | None, section: str | None = None):
+    """Re-fetch url with If-None-Match / If-Modified-Since.
+
+    Returns None when the page is unchanged (304, or same content hash),
+    so the caller can skip parsing it; otherwise the new body.
+    """
+    headers = {}
+    if previous is not None:
+        if previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+
+    with metrics.span(f"fetch_{section or 'page'}"):
+        resp = await http_client.get(url, headers=headers, timeout=15, max_bytes=_max_bytes(section), polite=True)
+    if resp.status_code == 304 and previous is not None:
+        log = _fetch_log.get()
+        if log is not None:
+            log[url] = previous
+        return None
+    resp.raise_for_status()
+    content_hash = _record(url, resp, section)
+    if previous is not None and previous.content_hash == content_hash:
+        return None
+    return resp.text
+
+class PageContext:
+    """Homepage fetched and parsed once, shared by every extractor"""
+
+    def __init__(self, base_url: str, html: str, parsed: html_parser.ParsedPage | None = None):
+        self.base_url = base_url
+        self.html = html
+        parsed = parsed or html_parser.parse_page(html)
+        self.title = parsed.title
+        # (href, lowercased link text) for every <a href>, walked once
+        self.anchors = [(href, text.lower()) for href, text in parsed.links]
+        # (href, link text) for a[href*='/products/']
+        self.product_links = [(href, text) for href, text in parsed.links if "/products/" in href]
+        self._soup = None
+
+    @property
+    def soup(self):
+        """Full BeautifulSoup tree, only built if something still needs it"""
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, "lxml")
+        return self._soup
+
+    @classmethod
+    async def from_html(cls, base_url: str, html: str):
+        # Large homepages are parsed in a worker thread so the event loop stays free
+        parsed = await html_parser.offload(html_parser.parse_page, html)
+        return cls(base_url, html, parsed)
+
+    @classmethod
+    async def load(cls, base_url: str):
+        html = await fetch_page(base_url, section="homepage")
+        return await cls.from_html(base_url, html)
+
+
+async def get_page(base_url: str, page: PageContext | None = None) -> PageContext:
+    """Reuse the shared homepage if the caller already loaded it"""
+    if page is not None:
+        return page
+    return await PageContext.load(base_url)
+
+def products_page_url(base_url: str, page_no: int, limit: int = PRODUCTS_PAGE_SIZE) -> str:
+    return f"{base_url}/products.json?limit={limit}&page={page_no}"
+
+
+async def fetch_products_page(base_url: str, page_no: int, limit: int = PRODUCTS_PAGE_SIZE):
+    """Fetch one page of /products.json (empty list past the last page).
+
+    A store without /products.json has an empty catalog; any other error
+    raises, so a page that failed is never mistaken for the end of the catalog.
+    """
+    url = products_page_url(base_url, page_no, limit)
+    with metrics.span("fetch_products"):
+        resp = await http_client.get(url, timeout=15, polite=True)
+    if resp.status_code != 200:
+        if page_no == 1 and 400 <= resp.status_code < 500 and resp.status_code != 429:
+            return []
         resp.raise_for_status()
-        return resp.text
+    _record(url, resp, "products")
+    return resp.json().get("products", [])
+
 
-async def get_product_catalog(base_url: str):
-    """Fetch products from /products.json endpoint"""
+async def iter_product_pages(base_url: str, max_products: int = MAX_PRODUCTS, prefetch: int = PRODUCT_PAGE_PREFETCH):
+    """Yield the catalog page by page as it arrives, up to max_products.
+
+    Once the first page comes back full, up to `prefetch` following pages
+    are requested concurrently; small stores still cost a single request.
+    """
+    pending = deque()
+    next_page = 1
+    window = 1
+    seen = 0
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{base_url}/products.json", timeout=15)
-            if resp.status_code == 200:
-                data = resp.json()
-                return data.get("products", [])
+        while seen < max_products:
+            while len(pending) < window and (next_page - 1) * PRODUCTS_PAGE_SIZE < max_products:
+                pending.append(asyncio.create_task(fetch_products_page(base_url, next_page)))
+                next_page += 1
+            if not pending:
+                break
+
+            products = await pending.popleft()
+            if not products:
+                break
+            full_page = len(products) >= PRODUCTS_PAGE_SIZE
+            products = products[:max_products - seen]
+            seen += len(products)
+            yield products
+
+            if not full_page:
+                break
+            window = max(1, prefetch)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class Catalog(list):
+    """Products of one store; complete is True only if every page was read and max_products wasn't hit"""
+    complete = False
+
+
+async def get_product_catalog(base_url: str, max_products: int = MAX_PRODUCTS) -> Catalog:
+    """Fetch products from /products.json endpoint (all pages, capped at max_products).
+
+    Pages are collected rather than passed on one by one: the snapshot, its
+    ETag and the removed-product diff in upsert_products all need the whole
+    catalog. iter_product_pages still overlaps the page requests.
+    """
+    products = Catalog()
+    try:
+        async for page in iter_product_pages(base_url, max_products):
+            products.extend(page)
     except Exception:
-        return []
-    return []
+        logging.warning("Catalog fetch for %s stopped after %d products", base_url, len(products), exc_info=True)
+    else:
+        products.complete = len(products) < max_products
+    return products
 
-async def get_hero_products(base_url: str):
+async def get_hero_products(base_url: str, page: PageContext | None = None):
     """Scrape home page for featured products"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
+        page = await get_page(base_url, page)
         hero = []
-        for product in soup.select("a[href*='/products/']"):
-            name = product.get_text(strip=True)
-            link = product.get("href")
+        for link, name in page.product_links:
             if name and link:
                 hero.append({"name": name, "url": base_url + link})
         return hero[:5]  # take top few
     except Exception:
         return []
 
-async def get_brand_name(base_url: str):
+async def get_brand_name(base_url: str, page: PageContext | None = None):
     """Get title/brand name"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
-        return soup.title.string if soup.title else None
+        page = await get_page(base_url, page)
+        return page.title
     except Exception:
         return None
 
-async def get_policies(base_url: str):
+async def get_policies(base_url: str, page: PageContext | None = None):
     """Scrape Privacy and Return/Refund policies"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
+        page = await get_page(base_url, page)
         privacy, returns = None, None
 
-        for a in soup.find_all("a", href=True):
-            link = a["href"].lower()
+        for href, _ in page.anchors:
+            link = href.lower()
             if "privacy" in link:
-                privacy = base_url + a["href"] if not a["href"].startswith("http") else a["href"]
+                privacy = base_url + href if not href.startswith("http") else href
             if "return" in link or "refund" in link:
-                returns = base_url + a["href"] if not a["href"].startswith("http") else a["href"]
+                returns = base_url + href if not href.startswith("http") else href
 
         return {"privacy_policy": privacy, "return_policy": returns}
     except:
         return {"privacy_policy": None, "return_policy": None}
 
 
-async def get_faqs(base_url: str):
+def find_faq_url(base_url: str, page: PageContext):
+    for href, _ in page.anchors:
+        if "faq" in href.lower():
+            return href if href.startswith("http") else base_url + href
+    return None
+
+
+class _Faqs(html_parser.TextTarget):
+    """h2 / h3 ending in "?" is a question, the next <p> its answer"""
+
+    def __init__(self, max_items: int):
+        super().__init__()
+        self.max_items = max_items
+        self.faqs = []
+        self.pending = []        # questions still waiting for their answer
+        self.heading = None      # (tag, depth, text parts) while inside a heading
+        self.answer = None       # (depth, text parts) while inside the answer <p>
+
+    def on_start(self, tag, attrib):
+        if tag in ("h2", "h3") and self.heading is None:
+            self.heading = (tag, self.depth, [])
+        elif tag == "p" and self.pending and self.answer is None:
+            self.answer = (self.depth, [])
+
+    def on_text(self, text: str):
+        text = text.strip()
+        if self.heading is not None:
+            self.heading[2].append(text)
+        if self.answer is not None:
+            self.answer[1].append(text)
+
+    def on_end(self, tag):
+        if self.heading is not None and self.heading[1] == self.depth:
+            question = "".join(self.heading[2])
+            self.heading = None
+            if question.endswith("?"):
+                self.pending.append(question)
+        elif self.answer is not None and self.answer[0] == self.depth:
+            answer = "".join(self.answer[1])
+            self.answer = None
+            self.faqs.extend({"question": q, "answer": answer} for q in self.pending)
+            self.pending = []
+            if len(self.faqs) >= self.max_items:
+                raise html_parser.Enough
+
+    def result(self):
+        faqs = self.faqs + [{"question": q, "answer": ""} for q in self.pending]
+        return faqs[:self.max_items]
+
+
+def parse_faqs(faq_html: str):
+    return html_parser.stream_text(faq_html, _Faqs(FAQ_MAX_ITEMS))
+
+
+async def get_faqs(base_url: str, page: PageContext | None = None):
     """Scrape FAQs (naive approach – looks for 'faq' page and extracts Q/A)"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
-        faq_url = None
-
-        for a in soup.find_all("a", href=True):
-            if "faq" in a["href"].lower():
-                faq_url = a["href"]
-                if not faq_url.startswith("http"):
-                    faq_url = base_url + faq_url
-                break
-
+        page = await get_page(base_url, page)
+        faq_url = find_faq_url(base_url, page)
         if not faq_url:
             return []
 
-        faq_html = await fetch_page(faq_url)
-        faq_soup = BeautifulSoup(faq_html, "lxml")
-
-        faqs = []
-        for q in faq_soup.find_all(["h2", "h3"]):
-            text = q.get_text(strip=True)
-            if text.endswith("?"):
-                ans = q.find_next("p").get_text(strip=True) if q.find_next("p") else ""
-                faqs.append({"question": text, "answer": ans})
-        return faqs
+        faq_html = await fetch_page(faq_url, section="faqs")
+        return await html_parser.offload(parse_faqs, faq_html)
     except:
         return []
 
 
-async def get_social_handles(base_url: str):
+async def get_social_handles(base_url: str, page: PageContext | None = None):
     """Extract social media links"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
+        page = await get_page(base_url, page)
         socials = {}
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
+        for href, _ in page.anchors:
             if "instagram.com" in href:
                 socials["instagram"] = href
             if "facebook.com" in href:
@@ -113,101 +352,107 @@ async def get_social_handles(base_url: str):
         return {}
 
 
-async def get_contact_details(base_url: str):
+EMPTY_CONTACT = {"emails": [], "phones": [], "address": None, "return_info": None, "other_info": None}
+
+
+def find_contact_url(base_url: str, page: PageContext):
+    for href, _ in page.anchors:
+        if "contact" in href.lower():
+            return href if href.startswith("http") else base_url.rstrip("/") + "/" + href.lstrip("/")
+    return None
+
+
+# Emails and phone numbers, found in one pass over each line
+CONTACT_PATTERN = re.compile(
+    r"(?P<email>[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})|(?P<phone>\+?\d[\d \-]{8,}\d)"
+)
+
+
+def parse_contact(contact_html: str):
+    emails, phones = {}, {}
+    return_lines, address_lines, other_lines = [], [], []
+    return_len = address_len = 0
+
+    # Visible text line by line; script / style never become text and
+    # parsing stops after CONTACT_TEXT_LIMIT characters
+    for line in html_parser.iter_text_lines(contact_html, CONTACT_TEXT_LIMIT):
+        for match in CONTACT_PATTERN.finditer(line):
+            (emails if match.lastgroup == "email" else phones)[match.group()] = None
+
+        # Look for common keywords
+        lower = line.lower()
+        if return_len < 300 and ("return" in lower or "refund" in lower):
+            return_lines.append(line)
+            return_len += len(line) + 1
+        if address_len < 200 and "address" in lower:
+            address_lines.append(line)
+            address_len += len(line) + 1
+
+        # Catch any extra instructions (store hours, shipping help, etc.)
+        if len(other_lines) < 3 and len(line.strip()) > 20:
+            other_lines.append(line.strip())
+
+    return {
+        "emails": list(emails),
+        "phones": list(phones),
+        "address": " ".join(address_lines)[:200] if address_lines else None,
+        "return_info": " ".join(return_lines)[:300] if return_lines else None,
+        "other_info": " ".join(other_lines)[:300] if other_lines else None,
+    }
+
+
+async def get_contact_details(base_url: str, page: PageContext | None = None):
     """Extract emails, phones, and other contact info"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
+        page = await get_page(base_url, page)
 
         # Find Contact page link
-        contact_url = None
-        for a in soup.find_all("a", href=True):
-            if "contact" in a["href"].lower():
-                contact_url = a["href"]
-                if not contact_url.startswith("http"):
-                    contact_url = base_url.rstrip("/") + "/" + contact_url.lstrip("/")
-                break
-
+        contact_url = find_contact_url(base_url, page)
         if not contact_url:
-            return {"emails": [], "phones": [], "address": None, "return_info": None, "other_info": None}
+            return dict(EMPTY_CONTACT)
 
         # Fetch Contact Us page
-        contact_html = await fetch_page(contact_url)
-        text = BeautifulSoup(contact_html, "lxml").get_text(" ")
-
-        # Extract emails & phones
-        emails = list(set(re.findall(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", text)))
-        phones = list(set(re.findall(r"\+?\d[\d \-]{8,}\d", text)))
+        contact_html = await fetch_page(contact_url, section="contact")
+        return await html_parser.offload(parse_contact, contact_html)
+    except Exception:
+        return dict(EMPTY_CONTACT)
 
-        # Extract sections
-        return_info = None
-        address = None
-        other_info = None
 
-        # Look for common keywords
-        if "return" in text.lower() or "refund" in text.lower():
-            return_info = " ".join([s for s in text.splitlines() if "return" in s.lower() or "refund" in s.lower()])[:300]
+def find_about_url(base_url: str, page: PageContext):
+    for href, text in page.anchors:
+        if "about" in text or "about" in href.lower():
+            return href if href.startswith("http") else base_url.rstrip("/") + "/" + href.lstrip("/")
+    return None
 
-        if "address" in text.lower():
-            address = " ".join([s for s in text.splitlines() if "address" in s.lower()])[:200]
 
-        # Catch any extra instructions (store hours, shipping help, etc.)
-        lines = [s.strip() for s in text.splitlines() if len(s.strip()) > 20]
-        if lines:
-            other_info = " ".join(lines[:3])[:300]
-
-        return {
-            "emails": emails,
-            "phones": phones,
-            "address": address,
-            "return_info": return_info,
-            "other_info": other_info
-        }
-    except Exception:
-        return {"emails": [], "phones": [], "address": None, "return_info": None, "other_info": None}
+def parse_about(about_html: str):
+    # Get only main content, not whole boilerplate
+    return html_parser.main_text(about_html, ABOUT_TEXT_LIMIT)
 
 
-async def get_about_text(base_url: str):
+async def get_about_text(base_url: str, page: PageContext | None = None):
     """Extract About Us section"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
-
-        about_url = None
-        for a in soup.find_all("a", href=True):
-            text = a.get_text(strip=True).lower()
-            href = a["href"].lower()
-
-            if "about" in text or "about" in href:
-                about_url = a["href"]
-                if not about_url.startswith("http"):
-                    about_url = base_url.rstrip("/") + "/" + about_url.lstrip("/")
-                break
-
+        page = await get_page(base_url, page)
+        about_url = find_about_url(base_url, page)
         if not about_url:
             return None
 
-        about_html = await fetch_page(about_url)
-        about_soup = BeautifulSoup(about_html, "lxml")
-
-        # Get only main content, not whole boilerplate
-        main_section = about_soup.find("main") or about_soup.find("div", {"class": "rte"}) or about_soup
-        return main_section.get_text(" ", strip=True)[:1000]  # limit text length
+        about_html = await fetch_page(about_url, section="about")
+        return await html_parser.offload(parse_about, about_html)
     except Exception:
         return None
 
 
-async def get_links(base_url: str):
+async def get_links(base_url: str, page: PageContext | None = None):
     """Extract important links (order tracking, blogs, contact)"""
     try:
-        html = await fetch_page(base_url)
-        soup = BeautifulSoup(html, "lxml")
+        page = await get_page(base_url, page)
         links = {}
 
-        for a in soup.find_all("a", href=True):
-            text = a.get_text(strip=True).lower()
-            href = a["href"].lower()
-            full_url = base_url + a["href"] if not a["href"].startswith("http") else a["href"]
+        for raw_href, text in page.anchors:
+            href = raw_href.lower()
+            full_url = base_url + raw_href if not raw_href.startswith("http") else raw_href
 
             # Order Tracking - check both href + text
             if ("order" in href and "track" in href) or ("track my order" in text) or ("order tracking" in text):
@@ -224,3 +469,209 @@ async def get_links(base_url: str):
         return links
     except Exception:
         return {}
+
+
+# name -> (extractor, dependency, empty default)
+# None: needs nothing, starts right away
+# "homepage": starts as soon as the shared PageContext is loaded
+# "subpage": same, then fetches one linked page (FAQ / contact / about)
+EXTRACTORS = {
+    "product_catalog": (get_product_catalog, None, list),
+    "brand_name": (get_brand_name, "homepage", lambda: None),
+    "hero_products": (get_hero_products, "homepage", list),
+    "policies": (get_policies, "homepage", dict),
+    "social_handles": (get_social_handles, "homepage", dict),
+    "links": (get_links, "homepage", dict),
+    "faqs": (get_faqs, "subpage", list),
+    "contact": (get_contact_details, "subpage", dict),
+    "about": (get_about_text, "subpage", lambda: None),
+}
+
+
+async def run_extractor(name: str, base_url: str, page: PageContext | None = None):
+    """Run one extractor under its timeout, falling back to its empty default"""
+    extractor, needs, default = EXTRACTORS[name]
+    if name == "product_catalog":
+        timeout = CATALOG_TIMEOUT
+    elif needs == "subpage":
+        timeout = SUBPAGE_TIMEOUT
+    else:
+        timeout = EXTRACTOR_TIMEOUT
+    args = (base_url,) if needs is None else (base_url, page)
+    try:
+        with metrics.span(f"extract_{name}"), metrics.extractor_seconds.time(name):
+            result = await asyncio.wait_for(extractor(*args), timeout)
+    except asyncio.TimeoutError:
+        logging.warning("Extractor %s timed out after %ss for %s", name, timeout, base_url)
+        result = default()
+    _report(name, result)
+    return result
+
+
+async def scrape_store(base_url: str) -> dict:
+    """Run every extractor concurrently and return {name: result}.
+
+    The catalog fetch overlaps with the homepage download; everything else
+    starts once the homepage is parsed, so total latency is roughly the
+    slowest single chain (homepage -> sub-page) rather than the sum.
+    """
+    independent = {
+        name: asyncio.create_task(run_extractor(name, base_url))
+        for name, (_, needs, _) in EXTRACTORS.items() if needs is None
+    }
+    try:
+        page = await PageContext.load(base_url)
+    except BaseException:
+        for task in independent.values():
+            task.cancel()
+        raise
+
+    dependent = [name for name, (_, needs, _) in EXTRACTORS.items() if needs is not None]
+    results = await asyncio.gather(
+        *(run_extractor(name, base_url, page) for name in dependent),
+        *independent.values(),
+    )
+    return dict(zip(dependent + list(independent), results))
+
+
+# Sub-page extractors split into (find the link on the homepage, parse the page)
+SUBPAGES = {
+    "faqs": (find_faq_url, parse_faqs),
+    "contact": (find_contact_url, parse_contact),
+    "about": (find_about_url, parse_about),
+}
+
+
+class ScrapeOutcome(NamedTuple):
+    results: dict                   # {name: result}, as returned by scrape_store
+    validators: dict                # url -> Validator for every page fetched
+    unchanged: set                  # result names reused from the previous scrape
+
+    @property
+    def catalog_complete(self) -> bool:
+        """The catalog is the store's whole catalog, so products missing from it were removed"""
+        return getattr(self.results.get("product_catalog"), "complete", False)
+
+
+async def _revalidate_subpage(name: str, base_url: str, page: PageContext | None, validators: dict, previous: dict):
+    find_url, parse = SUBPAGES[name]
+    if page is not None:
+        url = find_url(base_url, page)
+    else:
+        # Homepage unchanged → same link as last time
+        url = next((u for u, v in validators.items() if v.section == name), None)
+        if url is None:
+            return previous.get(name), True
+    if not url:
+        return EXTRACTORS[name][2](), False
+
+    html = await fetch_if_changed(url, validators.get(url), name)
+    if html is None:
+        return previous.get(name), True
+    return await html_parser.offload(parse, html), False
+
+
+async def _revalidate_catalog(base_url: str, validators: dict, previous: dict):
+    pages = sorted(
+        (u for u, v in validators.items() if v.section == "products"),
+        key=lambda u: int(parse_qs(urlsplit(u).query).get("page", ["0"])[0]),
+    )
+    known = previous.get("product_catalog")
+    if pages and known is not None:
+        probe = []
+        if len(known) == len(pages) * PRODUCTS_PAGE_SIZE and len(known) < MAX_PRODUCTS:
+            # Last known page was full: new products would start a page we've never fetched
+            probe = [fetch_products_page(base_url, len(pages) + 1)]
+        bodies = await asyncio.gather(*(fetch_if_changed(u, validators[u], "products") for u in pages), *probe)
+        if all(body is None for body in bodies[:len(pages)]) and not any(bodies[len(pages):]):
+            return known, True
+    # Something moved: pages shift as products come and go, so re-read it all
+    return await get_product_catalog(base_url), False
+
+
+def _keep_validators(name: str, validators: dict):
+    """Carry a section's old validators into this scrape's log (its pages weren't re-checked)"""
+    log = _fetch_log.get()
+    if log is None:
+        return
+    section = "products" if name == "product_catalog" else name
+    for url, v in validators.items():
+        if v.section == section:
+            log.setdefault(url, v)
+
+
+async def _timed(name: str, coro, timeout: float, previous: dict, validators: dict):
+    try:
+        with metrics.span(f"extract_{name}"), metrics.extractor_seconds.time(name):
+            outcome = await asyncio.wait_for(coro, timeout)
+    except Exception as e:
+        # Timeout or e.g. a 503 on one page: not known to be unchanged, so serve the
+        # previous value but don't count it as fresh
+        if isinstance(e, asyncio.TimeoutError):
+            logging.warning("Re-validating %s timed out after %ss", name, timeout)
+        else:
+            logging.warning("Re-validating %s failed", name, exc_info=True)
+        _keep_validators(name, validators)
+        outcome = previous.get(name, EXTRACTORS[name][2]()), False
+    _report(name, outcome[0])
+    return outcome
+
+
+async def rescrape_store(base_url: str, validators: dict | None = None, previous: dict | None = None) -> ScrapeOutcome:
+    """scrape_store that also returns page validators and skips unchanged pages.
+
+    With the validators and results of the previous scrape, every page is
+    re-fetched conditionally. A 304 (or identical content hash) reuses the
+    previous result for that section instead of parsing the page again,
+    and the section is reported in `unchanged` so the DB write can be
+    skipped too. Without them this is a plain scrape that records
+    validators for next time.
+    """
+    log = {}
+    token = _fetch_log.set(log)
+    try:
+        if not validators or previous is None:
+            return ScrapeOutcome(await scrape_store(base_url), log, set())
+
+        catalog = asyncio.create_task(
+            _timed("product_catalog", _revalidate_catalog(base_url, validators, previous), CATALOG_TIMEOUT, previous,
+                   validators)
+        )
+        try:
+            html = await fetch_if_changed(base_url, validators.get(base_url), "homepage")
+        except BaseException:
+            catalog.cancel()
+            raise
+        page = await PageContext.from_html(base_url, html) if html is not None else None
+
+        results, unchanged = {}, set()
+        homepage_names = [n for n, (_, needs, _) in EXTRACTORS.items() if needs == "homepage"]
+        if page is None:
+            for name in homepage_names:
+                results[name] = previous.get(name)
+                unchanged.add(name)
+                _report(name, results[name])
+            homepage_values = []
+        else:
+            homepage_values = [run_extractor(name, base_url, page) for name in homepage_names]
+
+        subpage_names = list(SUBPAGES)
+        gathered = await asyncio.gather(
+            *homepage_values,
+            *(
+                _timed(name, _revalidate_subpage(name, base_url, page, validators, previous), SUBPAGE_TIMEOUT, previous,
+                       validators)
+                for name in subpage_names
+            ),
+            catalog,
+        )
+        if page is not None:
+            results.update(zip(homepage_names, gathered[:len(homepage_names)]))
+            gathered = gathered[len(homepage_names):]
+        for name, (value, same) in zip(subpage_names + ["product_catalog"], gathered):
+            results[name] = value
+            if same:
+                unchanged.add(name)
+        return ScrapeOutcome(results, log, unchanged)
+    finally:
+        _fetch_log.reset(token)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from app.services.cache import CacheEntry, body_etag
+
+# SQLite file shared by every worker process on the host ("" disables the L2 cache).
+# app.serve points it at a private temp directory when running several workers.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+SHARED_CACHE_TTL_SECONDS = float(os.getenv("SHARED_CACHE_TTL_SECONDS", os.getenv("CACHE_TTL_SECONDS", "300")))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))
+# A worker that finds another worker scraping the same store waits this long for its result
+SHARED_SCRAPE_WAIT_SECONDS = float(os.getenv("SHARED_SCRAPE_WAIT_SECONDS", "60"))
+SHARED_SCRAPE_POLL_SECONDS = 0.25
+# Expired rows are purged (and the table trimmed to SHARED_CACHE_MAX_ENTRIES) every this many writes
+PURGE_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    scraped_at TEXT,
+    expires REAL NOT NULL,
+    stored REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+"""
+
+
+class SharedCache:
+    """Cross-process L2 cache of serialized responses in a SQLite file.
+
+    Sits behind each worker's in-memory LRU: a worker that misses its own
+    LRU finds bodies other workers already loaded or scraped. Leases let
+    one worker scrape a store while the others wait for its result.
+    Reads run in the thread pool; writes go through one background thread
+    so they never block a request.
+    """
+
+    def __init__(self, path: str, ttl: float = SHARED_CACHE_TTL_SECONDS, max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        # Table size as of the last purge (all processes); counted on the writer thread
+        self.entries = 0
+        self.size = 0
+        self.evictions = 0
+        # Owner-only; SQLite gives the -wal / -shm files the same mode
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+        self._writer.submit(self._safe_count)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections belong to the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _get_many(self, keys: list[str]) -> dict[str, CacheEntry]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT key, body, scraped_at FROM responses WHERE key IN ({placeholders}) AND expires > ?",
+            (*keys, time.time()),
+        ).fetchall()
+        return {
+            key: CacheEntry(body, datetime.fromisoformat(scraped_at) if scraped_at else None, body_etag(body))
+            for key, body, scraped_at in rows
+        }
+
+    async def get_many(self, keys: list[str]) -> dict[str, CacheEntry]:
+        if not keys:
+            return {}
+        try:
+            found = await run_in_threadpool(self._get_many, keys)
+        except sqlite3.Error as e:
+            logging.warning("Shared cache read failed: %s", e)
+            found = {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def get(self, key: str) -> CacheEntry | None:
+        return (await self.get_many([key])).get(key)
+
+    def _set(self, key: str, entry: CacheEntry, ttl: float):
+        now = time.time()
+        scraped_at = entry.scraped_at.isoformat() if entry.scraped_at else None
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, body, scraped_at, expires, stored) VALUES (?, ?, ?, ?, ?)",
+            (key, entry.body, scraped_at, now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            evicted = conn.execute("DELETE FROM responses WHERE expires <= ?", (now,)).rowcount
+            conn.execute("DELETE FROM leases WHERE expires <= ?", (now,))
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += evicted
+            self._count()
+
+    def _count(self):
+        self.entries, self.size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+        ).fetchone()
+
+    def _safe_count(self):
+        try:
+            self._count()
+        except sqlite3.Error as e:
+            logging.warning("Shared cache count failed: %s", e)
+
+    def _safe_set(self, key: str, entry: CacheEntry, ttl: float):
+        try:
+            self._set(key, entry, ttl)
+        except sqlite3.Error as e:
+            logging.warning("Shared cache write failed: %s", e)
+
+    def set(self, key: str, entry: CacheEntry, ttl: float | None = None):
+        """Store in the background (fire and forget)"""
+        self._writer.submit(self._safe_set, key, entry, self.ttl if ttl is None else ttl)
+
+    def _acquire(self, key: str, seconds: float) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now))
+            acquired = conn.execute(
+                "INSERT OR IGNORE INTO leases (key, expires) VALUES (?, ?)", (key, now + seconds),
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def _release(self, key: str):
+        self._conn().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+    async def produce_once(self, key: str, produce, since: datetime) -> bytes:
+        """Run produce() unless another process already is; then wait for its result.
+
+        Entries scraped at or after `since` count as the other process's
+        result. If none shows up within SHARED_SCRAPE_WAIT_SECONDS (or the
+        lease can't be taken) this process produces it itself.
+        """
+        try:
+            acquired = await run_in_threadpool(self._acquire, key, SHARED_SCRAPE_WAIT_SECONDS)
+        except sqlite3.Error as e:
+            logging.warning("Shared cache lease failed: %s", e)
+            acquired = True
+        if acquired:
+            try:
+                return await produce()
+            finally:
+                self._writer.submit(self._release, key)
+
+        deadline = time.monotonic() + SHARED_SCRAPE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SHARED_SCRAPE_POLL_SECONDS)
+            # The result is written before the lease is released, so read the lease first
+            leased = await run_in_threadpool(self._leased, key)
+            entry = await self.get(key)
+            if entry is not None and entry.scraped_at is not None and entry.scraped_at >= since:
+                return entry.body
+            if not leased:
+                break
+        return await produce()
+
+    def _leased(self, key: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM leases WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """hits / misses are this process's; entries / bytes are the whole file as of the last purge"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.entries,
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def open_shared_cache() -> SharedCache | None:
+    if not SHARED_CACHE_PATH:
+        return None
+    try:
+        return SharedCache(SHARED_CACHE_PATH)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning("Shared cache at %s unavailable, using per-process caching only: %s", SHARED_CACHE_PATH, e)
+        return None
@@ -0,0 +1,19 @@
+import asyncio
+import logging
+from app.services import http_client
+from app.services.jobs import JobRunner
+from app.services.refresher import RefreshScheduler
+
+
+async def main():
+	"""Standalone worker: re-scrapes tracked brands as they go stale and runs queued scrape jobs"""
+	await http_client.start()
+	try:
+		await asyncio.gather(RefreshScheduler().run(), JobRunner().run())
+	finally:
+		await http_client.close()
+
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.INFO)
+	asyncio.run(main())
@@ -0,0 +1,166 @@
+"""Local stand-in for Shopify storefronts, for offline benchmarks.
+
+Every store lives under /s/<store>/ on one server and serves a generated
+homepage, paginated /products.json, FAQ / contact / about pages and the
+two policy pages. Responses carry an ETag and honour If-None-Match, so
+re-scrapes exercise the conditional-GET path like a real store.
+
+    python -m bench.fake_shopify --port 8765 --products 2000 --latency-ms 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+
+@dataclass
+class StoreProfile:
+    products: int = 250          # catalog size of every store
+    latency_ms: float = 0        # delay added to every response
+    html_kb: int = 50            # approximate homepage / sub-page size
+    faqs: int = 20
+
+
+def _padding(kb: int, seed: str) -> str:
+    sentence = f"<p>{seed} sells carefully made everyday clothing, shipped worldwide.</p>\n"
+    return sentence * max(1, kb * 1024 // len(sentence))
+
+
+def homepage(store: str, profile: StoreProfile) -> str:
+    hero = "".join(f'<a href="/products/{store}-p{i}">Product {i}</a>' for i in range(8))
+    return f"""<html><head><title>Store {store}</title></head><body>
+<nav>
+  <a href="/pages/faq">FAQ</a> <a href="/pages/contact">Contact us</a> <a href="/pages/about-us">About</a>
+  <a href="/apps/order-tracking">Track my order</a> <a href="/blogs/news">Blog</a>
+  <a href="/policies/privacy-policy">Privacy policy</a> <a href="/policies/refund-policy">Refund policy</a>
+</nav>
+<main>{hero}{_padding(profile.html_kb, store)}</main>
+<footer><a href="https://instagram.com/{store}">Instagram</a> <a href="https://facebook.com/{store}">Facebook</a></footer>
+</body></html>"""
+
+
+def faq_page(store: str, profile: StoreProfile) -> str:
+    items = "".join(
+        f"<h3>How does question {i} work at {store}?</h3><p>Answer {i}: it just works.</p>"
+        for i in range(profile.faqs)
+    )
+    return f"<html><body><main>{items}{_padding(profile.html_kb // 2, store)}</main></body></html>"
+
+
+def contact_page(store: str, profile: StoreProfile) -> str:
+    return f"""<html><body><main>
+<p>Email us at support@{store}.example.com or call +91 98765 43210.</p>
+<p>Our address: 12 Market Road, Bengaluru</p>
+<p>Returns and refunds are accepted within 30 days of delivery.</p>
+{_padding(profile.html_kb // 2, store)}</main></body></html>"""
+
+
+def about_page(store: str, profile: StoreProfile) -> str:
+    return f"<html><body><main><h1>About {store}</h1>{_padding(profile.html_kb // 2, store)}</main></body></html>"
+
+
+def product(store: str, i: int) -> dict:
+    price = f"{499 + (i * 37) % 4500}.00"
+    return {
+        "id": 10_000_000 + i,
+        "title": f"{store} product {i}",
+        "handle": f"{store}-p{i}",
+        "body_html": f"<p>Soft cotton product {i}.</p>",
+        "vendor": store,
+        "product_type": "Apparel",
+        "tags": ["cotton", f"tag{i % 10}"],
+        "variants": [
+            {"id": 20_000_000 + i * 3 + v, "title": size, "price": price, "available": True}
+            for v, size in enumerate(("S", "M", "L"))
+        ],
+        "images": [{"src": f"https://cdn.example.com/{store}/{i}.jpg"}],
+    }
+
+
+def products_page(store: str, profile: StoreProfile, page: int, limit: int) -> bytes:
+    start = (page - 1) * limit
+    items = [product(store, i) for i in range(start, min(start + limit, profile.products))]
+    return json.dumps({"products": items}).encode()
+
+
+def create_app(profile: StoreProfile) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+    pages = {
+        "": homepage,
+        "pages/faq": faq_page,
+        "pages/contact": contact_page,
+        "pages/about-us": about_page,
+    }
+
+    def respond(request: Request, body: bytes, media_type: str) -> Response:
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type=media_type, headers={"ETag": etag})
+
+    @app.get("/s/{store}/products.json")
+    async def products_json(request: Request, store: str, page: int = 1, limit: int = 250):
+        app.state.requests += 1
+        if profile.latency_ms:
+            await asyncio.sleep(profile.latency_ms / 1000)
+        return respond(request, products_page(store, profile, page, limit), "application/json")
+
+    @app.get("/s/{store}")
+    @app.get("/s/{store}/{path:path}")
+    async def html(request: Request, store: str, path: str = ""):
+        app.state.requests += 1
+        if profile.latency_ms:
+            await asyncio.sleep(profile.latency_ms / 1000)
+        render = pages.get(path.strip("/"))
+        if render is None:
+            return Response(f"<html><body><main>{store} {path}</main></body></html>", media_type="text/html")
+        return respond(request, render(store, profile).encode(), "text/html")
+
+    return app
+
+
+class FakeShopify:
+    """Runs the stand-in server on a background thread"""
+
+    def __init__(self, profile: StoreProfile | None = None, host: str = "127.0.0.1", port: int = 8765):
+        self.profile = profile or StoreProfile()
+        self.app = create_app(self.profile)
+        self.base = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def store_url(self, store) -> str:
+        return f"{self.base}/s/{store}"
+
+    @property
+    def requests(self) -> int:
+        return self.app.state.requests
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=250)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--html-kb", type=int, default=50)
+    args = parser.parse_args()
+    profile = StoreProfile(products=args.products, latency_ms=args.latency_ms, html_kb=args.html_kb)
+    uvicorn.run(create_app(profile), host=args.host, port=args.port)
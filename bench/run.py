@@ -0,0 +1,199 @@
+"""Offline benchmarks for the insights API.
+
+Drives the FastAPI app in-process against the local fake Shopify server
+(bench/fake_shopify.py) and a throwaway SQLite database, then reports
+requests/sec, p50/p95/p99 latency and peak RSS per scenario:
+
+    cold   every request scrapes a store nobody has seen (scrape + save_to_db)
+    warm   stores already in the DB, in-memory cache disabled (DB read path)
+    hot    stores already in the in-memory cache
+    batch  /fetch_store_insights/batch fan-out over fresh stores
+    large  cold scrapes of stores with a big catalog (--large-products)
+
+    python -m bench.run --scenario all --requests 200 --concurrency 16 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import NamedTuple
+
+from bench.fake_shopify import FakeShopify, StoreProfile
+
+
+class Result(NamedTuple):
+    scenario: str
+    requests: int
+    errors: int
+    seconds: float
+    latencies: list[float]
+    upstream_requests: int
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def summary(self) -> dict:
+        return {
+            "scenario": self.scenario,
+            "requests": self.requests,
+            "errors": self.errors,
+            "req_per_s": round(self.requests / self.seconds, 1) if self.seconds else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "upstream_requests": self.upstream_requests,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def configure_env(args, db_dir: str):
+    """Profile for the app under test; must run before anything imports app.*"""
+    os.environ.setdefault("DATABASE_URL", args.db or f"sqlite:///{os.path.join(db_dir, 'bench.db')}")
+    # Every fake store shares one host, so lift the per-host politeness limits
+    os.environ.setdefault("HTTP_PER_HOST_LIMIT", str(max(args.concurrency * 4, 16)))
+    os.environ.setdefault("DOMAIN_RATE", "100000")
+    os.environ.setdefault("DOMAIN_BURST", "100000")
+    os.environ.setdefault("HTTP_MAX_RETRIES", "0")
+    os.environ.setdefault("SERVER_TIMING", "0")
+    os.environ.setdefault("REFRESH_IN_PROCESS", "0")
+
+
+async def run_load(name: str, send, requests: int, concurrency: int, server: FakeShopify) -> Result:
+    """Call send(i) for i in range(requests), at most `concurrency` at a time"""
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    upstream_before = server.requests
+
+    async def one(i):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                resp = await send(i)
+                resp.raise_for_status()
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return Result(name, requests, errors, time.perf_counter() - start, latencies, server.requests - upstream_before)
+
+
+async def run_scenarios(args, server: FakeShopify) -> list[Result]:
+    import httpx
+    from app.db import Base, engine
+    import app.models_db  # noqa: F401  (register the tables)
+    from app.main import app
+    from app.services import http_client, insights_service
+
+    Base.metadata.create_all(bind=engine)
+    await http_client.start()
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        def fetch(prefix):
+            return lambda i: client.post("/fetch_store_insights", json={"website_url": server.store_url(f"{prefix}{i}")})
+
+        wanted = args.scenario
+        if wanted in ("cold", "all"):
+            results.append(await run_load("cold", fetch("cold"), args.requests, args.concurrency, server))
+
+        if wanted in ("warm", "hot", "all"):
+            # Seed a small working set, then read it over and over
+            stores = min(args.requests, args.stores)
+            await run_load("seed", fetch("warm"), stores, args.concurrency, server)
+            seeded = lambda i: client.post("/fetch_store_insights", json={"website_url": server.store_url(f"warm{i % stores}")})
+
+            if wanted in ("warm", "all"):
+                max_entries = insights_service.response_cache.max_entries
+                insights_service.response_cache.clear()
+                insights_service.response_cache.max_entries = 0  # every lookup goes to the DB
+                try:
+                    results.append(await run_load("warm", seeded, args.requests, args.concurrency, server))
+                finally:
+                    insights_service.response_cache.max_entries = max_entries
+
+            if wanted in ("hot", "all"):
+                await run_load("prime", seeded, stores, args.concurrency, server)
+                results.append(await run_load("hot", seeded, args.requests, args.concurrency, server))
+
+        if wanted in ("batch", "all"):
+            size = args.batch_size
+            batches = max(1, args.requests // size)
+            send = lambda i: client.post("/fetch_store_insights/batch", json={
+                "website_urls": [server.store_url(f"batch{i}-{j}") for j in range(size)],
+            })
+            result = await run_load("batch", send, batches, max(1, args.concurrency // size), server)
+            results.append(result._replace(scenario=f"batch x{size}"))
+
+        if wanted in ("large", "all"):
+            products = server.profile.products
+            server.profile.products = args.large_products
+            try:
+                count = max(1, args.requests // 20)
+                results.append(await run_load(f"large ({args.large_products} products)", fetch("large"),
+                                              count, min(args.concurrency, count), server))
+            finally:
+                server.profile.products = products
+
+    await http_client.close()
+    return results
+
+
+def print_table(rows: list[dict]):
+    columns = list(rows[0])
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["cold", "warm", "hot", "batch", "large", "all"], default="all")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stores", type=int, default=20, help="working set for warm / hot")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--products", type=int, default=250)
+    parser.add_argument("--large-products", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every fake store response")
+    parser.add_argument("--html-kb", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--json", action="store_true", help="print JSON lines instead of a table")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        configure_env(args, db_dir)
+        profile = StoreProfile(products=args.products, latency_ms=args.latency_ms, html_kb=args.html_kb)
+        with FakeShopify(profile, port=args.port) as server:
+            results = asyncio.run(run_scenarios(args, server))
+
+    rows = [r.summary() for r in results]
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+from app.services.cache import CacheEntry, LRUCache
+
+
+def test_oversized_set_drops_the_old_entry():
+    cache = LRUCache(max_bytes=10)
+    cache.set("k", CacheEntry(b"old"))
+    cache.set("k", CacheEntry(b"x" * 20))
+    assert cache.get("k") is None
+    assert cache.size == 0
@@ -0,0 +1,47 @@
+import asyncio
+import httpx
+from app.services import scraper
+from app.services.scraper import Validator, products_page_url
+
+BASE = "https://store.example"
+
+
+def _validators(pages: int) -> dict:
+    return {
+        products_page_url(BASE, n): Validator("products", f'"p{n}"', None, f"hash{n}")
+        for n in range(1, pages + 1)
+    }
+
+
+def test_failed_catalog_revalidation_keeps_previous(monkeypatch):
+    validators = _validators(3)
+    known = [{"id": i} for i in range(600)]
+
+    async def fetch_if_changed(url, previous, section=None):
+        if url.endswith("page=2"):
+            request = httpx.Request("GET", url)
+            raise httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))
+        return None
+
+    async def get_product_catalog(base_url, *args):
+        raise AssertionError("a failed re-validation must not re-read the catalog")
+
+    monkeypatch.setattr(scraper, "fetch_if_changed", fetch_if_changed)
+    monkeypatch.setattr(scraper, "get_product_catalog", get_product_catalog)
+
+    async def run():
+        log = {}
+        token = scraper._fetch_log.set(log)
+        try:
+            outcome = await scraper._timed(
+                "product_catalog", scraper._revalidate_catalog(BASE, validators, {"product_catalog": known}),
+                5, {"product_catalog": known}, validators,
+            )
+        finally:
+            scraper._fetch_log.reset(token)
+        return outcome, log
+
+    (catalog, unchanged), log = asyncio.run(run())
+    assert catalog is known
+    assert not unchanged
+    assert log == validators